@@ -1,29 +1,35 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 import streamlit.components.v1 as components
-import io
+
+import configuracao
+from armazem import armazem
+from banco import ConsultaRazao, abre_banco
+from cache_planilhas import cache_conjuntos, carrega_planilha, hash_conteudo
+from ingestao import PlanilhaInvalida, VERSAO as VERSAO_INGESTAO, le_razao
+from agregacao import entradas_saidas_mensal, resumo_por_conta, totais_por_conta
+from exportacao import (
+    FORMATOS, LIMITE_LINHAS_XLSX, MIME_XLSX, chave_filtros, exporta_razao, memoizado, resumo_xlsx,
+)
+from filtros import IndiceRazao, ParteRazao
+from formatacao import formata_tabela_brasil, formata_valor_brasil
+from graficos import (
+    figura, grafico_entradas, grafico_evolucao, grafico_por_tipo, grafico_sparkline, grafico_top_saidas,
+)
+from instrumentacao import etapa, inicia_execucao, medido, registros_da_execucao
+from paginacao import total_paginas
+from kpis import (
+    calcula_kpis, carrega_definicoes, clientes, compara_kpis, compila_para_cliente, evolucao_kpi, metricas_periodo,
+    presenca_kpis,
+)
+from razao import com_rotulo_mes, rotulo_mes
 
 # ------------------------------------------------------------------------------
 # Configuração da página
 # ------------------------------------------------------------------------------
 st.set_page_config(page_title="Dashboard Contábil", layout="wide")
-
-# ------------------------------------------------------------------------------
-# Funções auxiliares
-# ------------------------------------------------------------------------------
-def convert_df_to_xlsx(df):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Resumo')
-    return output.getvalue()
-
-def formata_valor_brasil(valor):
-    if pd.isnull(valor):
-        return ""
-    # Formata para o padrão brasileiro: milhar com ponto e decimal com vírgula
-    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+inicia_execucao()
 
 # ------------------------------------------------------------------------------
 # Injeção de CSS para customização visual
@@ -82,116 +88,445 @@ components.html(
 # ------------------------------------------------------------------------------
 st.sidebar.title("⚙️ Configurações")
 
-uploaded_file = st.sidebar.file_uploader("📥 Importar arquivo Excel", type=["xlsx"])
-if uploaded_file is not None:
-    with st.spinner("Carregando arquivo..."):
-        df = pd.read_excel(uploaded_file)
-        st.session_state['df'] = df
-    st.sidebar.success("Arquivo carregado com sucesso.")
-elif 'df' in st.session_state:
-    df = st.session_state['df']
+uploaded_files = st.sidebar.file_uploader("📥 Importar arquivos Excel (um ou mais, ex.: um por mês)",
+                                          type=["xlsx"], accept_multiple_files=True)
+
+# Cada planilha é lida do Excel uma única vez: o hash do conteúdo a identifica
+# no armazém particionado por mês (armazem.py). Os índices
+# e o cubo de cada planilha (filtros.ParteRazao) são montados uma vez e
+# reaproveitados pelo conjunto seguinte da sessão, então incluir um mês novo
+# custa só a leitura, os índices e o cubo desse mês.
+def carrega_arquivo(arquivo, barra_progresso):
+    def mostra_progresso(lidas, total):
+        barra_progresso.progress(min(lidas / total, 1.0) if total else 1.0,
+                                 text=f"{arquivo.name}: {lidas:,} linhas lidas".replace(",", "."))
+
+    # Só as leituras de fato do Excel (fora dos caches) são medidas
+    def le(dados):
+        with etapa("leitura_excel") as medicao:
+            df = le_razao(dados, mostra_progresso)
+            medicao.saida(len(df))
+        return df
+
+    return carrega_planilha(arquivo.getvalue(), leitor=le, versao=VERSAO_INGESTAO, disco=armazem)
+
+
+# Hash do conteúdo de um arquivo enviado, calculado uma vez por upload
+def chave_do_arquivo(arquivo):
+    chaves_por_id = st.session_state.setdefault('chaves_por_id', {})
+    if arquivo.file_id not in chaves_por_id:
+        chaves_por_id[arquivo.file_id] = hash_conteudo(arquivo.getvalue())
+    return chaves_por_id[arquivo.file_id]
+
+
+# Planilhas recusadas na sessão (hash do conteúdo -> motivo): enquanto continuam
+# no upload, o erro é repetido sem ler o arquivo de novo
+def planilhas_rejeitadas():
+    return st.session_state.setdefault('rejeitadas', {})
+
+
+def mostra_rejeicao(arquivo, motivo):
+    st.sidebar.error(f"{arquivo.name}: {motivo}")
+
+
+# Lê a planilha (ou a busca no armazém) e devolve o razão, ou None se ela for
+# recusada; o motivo fica em planilhas_rejeitadas()
+def carrega_ou_rejeita(chave_arquivo, arquivo, barra_progresso):
+    try:
+        return carrega_arquivo(arquivo, barra_progresso)[1]
+    except PlanilhaInvalida as erro:
+        planilhas_rejeitadas()[chave_arquivo] = str(erro)
+        mostra_rejeicao(arquivo, erro)
+        return None
+
+
+# Chave do conjunto formado pelas planilhas (hashes de conteúdo) enviadas. Não
+# depende da ordem do upload: os mesmos arquivos, em qualquer ordem, são o
+# mesmo conjunto (e o índice junta as planilhas na ordem dos hashes)
+def chave_conjunto(chaves):
+    chaves = sorted(chaves)
+    if len(chaves) <= 1:
+        return chaves[0] if chaves else None
+    return hash_conteudo(" ".join(chaves).encode())
+
+
+def monta_parte(chave_arquivo, df):
+    with etapa("indice_planilha", entrada=len(df)):
+        return ParteRazao(df, chave_arquivo)
+
+
+# Monta a parte das planilhas de `arquivos` que ainda não estão em `partes`;
+# as recusadas saem de `arquivos`
+def carrega_partes(arquivos, partes):
+    barra_progresso = st.sidebar.empty()
+    for chave_arquivo, arquivo in list(arquivos.items()):
+        if chave_arquivo in partes:
+            continue
+        df_arquivo = carrega_ou_rejeita(chave_arquivo, arquivo, barra_progresso)
+        if df_arquivo is None:
+            del arquivos[chave_arquivo]
+            continue
+        partes[chave_arquivo] = monta_parte(chave_arquivo, df_arquivo)
+    barra_progresso.empty()
+
+
+# Índice de filtros das planilhas juntas (na ordem de chave_conjunto), a partir
+# da parte de cada uma: as que já estão em `partes` são reaproveitadas e só as
+# demais são lidas
+@medido("monta_conjunto")
+def monta_conjunto(arquivos, partes):
+    carrega_partes(arquivos, partes)
+    if not arquivos:
+        raise PlanilhaInvalida("Nenhuma das planilhas enviadas pôde ser carregada.")
+    with etapa("indice_filtros") as medicao:
+        indice = IndiceRazao([partes[c] for c in sorted(arquivos)])
+        medicao.saida(indice.n_linhas)
+    return indice
+
+usa_banco = configuracao.BACKEND != "memoria"
+
+chave = None
+if usa_banco:
+    # Lançamentos num banco local (DuckDB/SQLite), separados por cliente: cada
+    # planilha é importada uma vez e os filtros e agregações rodam em SQL. O
+    # cliente vê todo o histórico já importado, sem reenviar os arquivos.
+    banco = abre_banco()
+    novo_cliente = "➕ Novo cliente"
+    escolha_cliente = st.sidebar.selectbox("🏢 Cliente (base local):", banco.clientes() + [novo_cliente])
+    cliente_banco = escolha_cliente
+    if escolha_cliente == novo_cliente:
+        cliente_banco = st.sidebar.text_input("Nome do novo cliente:").strip()
+    if uploaded_files and cliente_banco:
+        importados = st.session_state.setdefault('importados', set())
+        rejeitadas = planilhas_rejeitadas()
+        with st.spinner("Importando arquivos..."):
+            barra_progresso = st.sidebar.empty()
+            for arquivo in uploaded_files:
+                if (cliente_banco, arquivo.file_id) in importados:
+                    continue
+                chave_arquivo = chave_do_arquivo(arquivo)
+                if chave_arquivo in rejeitadas:
+                    mostra_rejeicao(arquivo, rejeitadas[chave_arquivo])
+                    continue
+                if not banco.contem(cliente_banco, chave_arquivo):
+                    df_arquivo = carrega_ou_rejeita(chave_arquivo, arquivo, barra_progresso)
+                    if df_arquivo is None:
+                        continue
+                    banco.importa(cliente_banco, chave_arquivo, arquivo.name, df_arquivo)
+                importados.add((cliente_banco, arquivo.file_id))
+            barra_progresso.empty()
+    if cliente_banco:
+        chave = banco.versao(cliente_banco)
+    if chave is not None:
+        arquivos_cliente = banco.arquivos(cliente_banco)
+        st.sidebar.success(f"{len(arquivos_cliente)} arquivo(s) de {cliente_banco} na base local "
+                           f"({arquivos_cliente['linhas'].sum()} lançamentos).")
+    else:
+        st.sidebar.warning("Escolha o cliente e faça o upload dos arquivos Excel para começar.")
+elif uploaded_files:
+    rejeitadas = planilhas_rejeitadas()
+    arquivos = {}
+    for arquivo in uploaded_files:
+        chave_arquivo = chave_do_arquivo(arquivo)
+        if chave_arquivo in rejeitadas:
+            mostra_rejeicao(arquivo, rejeitadas[chave_arquivo])
+            continue
+        # O mesmo conteúdo enviado duas vezes entra uma vez só
+        arquivos.setdefault(chave_arquivo, arquivo)
+    chave = chave_conjunto(arquivos)
+    reserva = st.session_state.get('reserva')
+    # Partes (índices e cubo de cada planilha) do conjunto que a sessão já usa
+    partes = {} if reserva is None else {parte.chave: parte for parte in reserva.item.partes}
+    if (reserva is None or reserva.chave != chave) and chave not in cache_conjuntos:
+        # Conjunto novo para o processo: as planilhas que não estão no conjunto
+        # atual da sessão são carregadas (e validadas) e ganham sua parte
+        with st.spinner("Carregando arquivos..."):
+            carrega_partes(arquivos, partes)
+        chave = chave_conjunto(arquivos)
+
+    if arquivos and (reserva is None or reserva.chave != chave):
+        with st.spinner("Carregando arquivos..."):
+            if reserva is not None:
+                reserva.libera()
+                del st.session_state['reserva']
+            try:
+                reserva = cache_conjuntos.reserva(chave, lambda: monta_conjunto(arquivos, partes))
+                st.session_state['reserva'] = reserva
+            except PlanilhaInvalida:
+                # Todas as planilhas recusadas ao remontar o conjunto (os
+                # motivos já foram mostrados)
+                arquivos = {}
+    if arquivos:
+        st.sidebar.success(f"{len(arquivos)} arquivo(s) carregado(s) com sucesso "
+                           f"({reserva.item.n_linhas} lançamentos).")
+    else:
+        chave = None
+elif 'reserva' in st.session_state:
+    chave = st.session_state['reserva'].chave
 else:
-    df = None
     st.sidebar.warning("Por favor, faça o upload de um arquivo Excel para começar.")
 
-if df is not None:
-    all_accounts = sorted(df["ContaContabil"].unique())
-    select_all = st.sidebar.checkbox("Selecionar todas as contas", value=True)
-    if select_all:
-        selected_accounts_global = all_accounts
+if not usa_banco:
+    with st.sidebar.expander("🧠 Cache compartilhado"):
+        uso = cache_conjuntos.estatisticas()
+        st.caption(
+            f"{uso['itens']} conjunto(s) em memória, {uso['em_uso']} em uso por {uso['reservas']} sessão(ões); "
+            f"{uso['bytes'] / 2**20:.0f} MB de {uso['limite_bytes'] / 2**20:.0f} MB. "
+            f"Acertos: {uso['acertos']} · falhas: {uso['falhas']}."
+        )
+
+# Clientes com KPIs próprios definidos em kpis.json
+cliente_kpis = None
+clientes_kpis = clientes(carrega_definicoes())
+if chave is not None and clientes_kpis:
+    cliente_kpis = st.sidebar.selectbox("👤 Cliente (indicadores):", ["Padrão"] + clientes_kpis)
+    if cliente_kpis == "Padrão":
+        cliente_kpis = None
+
+# Índices de filtro (ou consultas ao banco), montados uma vez por conjunto de
+# planilhas carregado. Em memória, o índice (com o razão) é compartilhado por
+# todas as sessões que abriram as mesmas planilhas.
+indice = None
+if chave is not None:
+    if not usa_banco:
+        indice = st.session_state['reserva'].item
     else:
-        selected_accounts_global = st.sidebar.multiselect("Selecione as Contas (global):", 
-                                                           options=all_accounts, default=all_accounts)
-    df = df[df["ContaContabil"].isin(selected_accounts_global)]
+        if st.session_state.get('indice_chave') != chave:
+            st.session_state['indice'] = ConsultaRazao(banco, cliente_banco)
+            st.session_state['indice_chave'] = chave
+        indice = st.session_state['indice']
+
+if indice is not None and indice.n_linhas_sem_data():
+    st.sidebar.warning(f"{indice.n_linhas_sem_data()} lançamento(s) sem data válida (vazia ou em formato não "
+                       "reconhecido) aparecem em Mês/Ano como NaT.")
 
 # ------------------------------------------------------------------------------
-# Conversão da coluna "Data" e filtro por "Mês/Ano"
+# Filtros da barra lateral: cada um vira uma seleção por código (contas, meses,
+# grupo), sem copiar o razão. A seleção é aplicada uma única vez, no cubo.
 # ------------------------------------------------------------------------------
-if df is not None:
-    df['Data'] = pd.to_datetime(df['Data'], dayfirst=True, errors='coerce')
-    df['Mês/Ano'] = df['Data'].dt.to_period('M').astype(str)
-    all_months = sorted(df["Mês/Ano"].unique())
-    selected_months = st.sidebar.multiselect("Selecione os meses (Mês/Ano):", options=all_months, default=all_months)
-    df = df[df["Mês/Ano"].isin(selected_months)]
-    
-    if 'GrupoDeConta' in df.columns:
-        grupos_unicos = df['GrupoDeConta'].dropna().unique()
-        grupo_selecionado = st.sidebar.selectbox("🗂️ Filtrar por Grupo de Conta:", ["Todos"] + list(grupos_unicos))
-        if grupo_selecionado != "Todos":
-            df = df[df['GrupoDeConta'] == grupo_selecionado]
-    
-    filtro_conta = st.sidebar.text_input("🔍 Filtrar Conta Contábil (texto):")
-    if filtro_conta:
-        df = df[df['ContaContabil'].str.contains(filtro_conta, case=False, na=False)]
+if indice is not None:
+    with etapa("filtros_barra_lateral", entrada=len(indice.contas)) as medicao:
+        all_accounts = list(indice.contas)
+        select_all = st.sidebar.checkbox("Selecionar todas as contas", value=True)
+        if select_all:
+            selected_accounts_global = all_accounts
+            contas_ok = np.ones(len(all_accounts), dtype=bool)
+        else:
+            selected_accounts_global = st.sidebar.multiselect("Selecione as Contas (global):", 
+                                                               options=all_accounts, default=all_accounts)
+            contas_ok = np.isin(all_accounts, selected_accounts_global)
+
+        meses = indice.meses_com_lancamentos(contas_ok)
+        rotulo_por_mes = {codigo: rotulo_mes(codigo) for codigo in meses}
+        all_months = [rotulo_por_mes[codigo] for codigo in meses]
+        selected_months = st.sidebar.multiselect("Selecione os meses (Mês/Ano):", options=all_months, default=all_months)
+        rotulos_selecionados = set(selected_months)
+        meses_selecionados = [codigo for codigo in meses if rotulo_por_mes[codigo] in rotulos_selecionados]
+
+        # Grupo que não pôde ser convertido em um conjunto de contas (uma mesma conta
+        # em mais de um grupo) é filtrado pelas linhas
+        grupo_filtro = None
+        if indice.grupos is not None:
+            grupos_unicos = indice.grupos_presentes(contas_ok, meses_selecionados)
+            grupo_selecionado = st.sidebar.selectbox("🗂️ Filtrar por Grupo de Conta:", ["Todos"] + list(grupos_unicos))
+            if grupo_selecionado != "Todos":
+                contas_grupo = indice.contas_do_grupo(grupo_selecionado)
+                if contas_grupo is not None:
+                    contas_ok = contas_ok & contas_grupo
+                else:
+                    grupo_filtro = grupo_selecionado
+
+        filtro_conta = st.sidebar.text_input("🔍 Filtrar Conta Contábil (texto):",
+                                             help="Ignora maiúsculas e acentos. Comece com ^ para buscar pelo início do nome.")
+        if filtro_conta:
+            # Busca feita apenas sobre os nomes distintos de conta (índice pré-calculado)
+            if filtro_conta.startswith("^"):
+                contas_ok = contas_ok & indice.busca_contas.mascara(filtro_conta[1:], prefixo=True)
+            else:
+                contas_ok = contas_ok & indice.busca_contas.mascara(filtro_conta)
+        medicao.saida(int(contas_ok.sum()))
+
+# ------------------------------------------------------------------------------
+# Conteúdo das abas
+# Cada aba é um fragmento: seus controles (paginação, exportação) reexecutam só
+# a própria aba, sem refazer o script inteiro. E cada uma só é chamada quando
+# está aberta, então gráficos e tabelas das outras abas não são calculados.
+# ------------------------------------------------------------------------------
+@st.fragment
+@medido("aba_resumo")
+def aba_resumo(cubo, kpis_mensais, kpis_compilados):
+    st.markdown("<h2>Resumo por Conta Contábil</h2>", unsafe_allow_html=True)
+    resumo_pivot = resumo_por_conta(cubo)
+    with st.container():
+        st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+        st.table(formata_tabela_brasil(resumo_pivot))
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    st.markdown("<h2>Indicadores por Mês/Ano</h2>", unsafe_allow_html=True)
+    indicadores = kpis_mensais.rename(columns=kpis_compilados.titulos).T
+    with st.container():
+        st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+        st.table(formata_tabela_brasil(indicadores))
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
+@st.fragment
+@medido("aba_dados")
+def aba_dados(indice, contas_ok, meses_selecionados, grupo_filtro):
+    st.markdown("<h2>Dados Importados</h2>", unsafe_allow_html=True)
+    # Ordenação e paginação no servidor: só a página visível é formatada e enviada
+    n_linhas = indice.n_linhas_filtradas(contas_ok, meses_selecionados, grupo_filtro)
+    colunas_ordem = ['Valor', 'Data', 'ContaContabil'] + (['GrupoDeConta'] if indice.grupos is not None else [])
+    col_ordem, col_direcao, col_tamanho, col_pagina = st.columns(4)
+    coluna_ordem = col_ordem.selectbox("Ordenar por:", colunas_ordem)
+    direcao = col_direcao.selectbox("Ordem:", ["Decrescente", "Crescente"])
+    tamanho_pagina = col_tamanho.selectbox("Linhas por página:", [50, 100, 500])
+    n_paginas = total_paginas(n_linhas, tamanho_pagina)
+    pagina = col_pagina.number_input(f"Página (de {n_paginas}):", min_value=1, max_value=n_paginas, value=1)
+    with etapa("pagina_ordenada", entrada=n_linhas) as medicao:
+        df_pagina = indice.pagina(contas_ok, meses_selecionados, grupo_filtro, coluna_ordem, direcao == "Crescente",
+                                  pagina, tamanho_pagina)
+        medicao.saida(len(df_pagina))
+    df_pagina = com_rotulo_mes(df_pagina)
+    df_pagina['Valor'] = formata_valor_brasil(df_pagina['Valor'])
+    primeira_linha = (pagina - 1) * tamanho_pagina + 1 if len(df_pagina) else 0
+    st.caption(f"Exibindo linhas {primeira_linha}–{primeira_linha + len(df_pagina) - 1 if len(df_pagina) else 0} "
+               f"de {n_linhas}")
+    with st.container():
+        st.markdown("<div class='data-container'>", unsafe_allow_html=True)
+        st.dataframe(df_pagina, hide_index=True, use_container_width=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
+def mostra_grafico(fig):
+    with st.container():
+        st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+
+
+@st.fragment
+@medido("aba_graficos")
+def aba_graficos(cubo, kpis_mensais, kpis_compilados):
+    kpis_presenca = presenca_kpis(cubo, kpis_compilados)
+
+    st.subheader("Entradas (Valores Positivos)")
+    df_positivo_agrupado = totais_por_conta(cubo, sinal=1)
+    if not df_positivo_agrupado.empty:
+        mostra_grafico(figura(grafico_entradas, df_positivo_agrupado))
+    else:
+        st.write("Não há valores positivos para exibir.")
+
+    st.subheader("Saídas (Valores Negativos)")
+    df_negativo_agrupado = totais_por_conta(cubo, sinal=-1)
+    if not df_negativo_agrupado.empty:
+        mostra_grafico(figura(grafico_top_saidas, df_negativo_agrupado))
+    else:
+        st.write("Não há valores negativos para exibir.")
+
+    st.subheader("Entradas x Saídas (por Mês/Ano)")
+    df_dre = entradas_saidas_mensal(cubo)
+    if not df_dre.empty:
+        mostra_grafico(figura(grafico_por_tipo, df_dre, 'Entradas x Saídas (por Mês/Ano)'))
+    else:
+        st.write("Não há dados suficientes para exibir o gráfico de Entradas x Saídas.")
+
+    st.subheader("Evolução da Contribuição Ajustada (por Mês/Ano)")
+    df_pivot = evolucao_kpi(cubo, kpis_compilados, kpis_mensais, 'contribuicao_ajustada')
+    fig_evol = figura(grafico_evolucao, df_pivot, kpis_compilados.contas['contribuicao_ajustada'],
+                      kpis_compilados.titulos['contribuicao_ajustada'])
+    with st.container():
+        st.plotly_chart(fig_evol, use_container_width=True)
+
+    st.subheader("Comparação: (Receita Vendas ML + SH) vs (Impostos - DAS Simples Nacional)")
+    df_comparacao_melt = compara_kpis(kpis_mensais, kpis_presenca, 'receitas', 'Receitas',
+                                      'impostos_das_bruto', 'Impostos')
+    if not df_comparacao_melt.empty:
+        mostra_grafico(figura(grafico_por_tipo, df_comparacao_melt,
+                              '(Receita Vendas ML + SH) vs (Impostos - DAS Simples Nacional)'))
+    else:
+        st.write("Não há dados para gerar a comparação entre Receitas e Impostos (DAS).")
+
+    # Exibe o gráfico de Comparação: (Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)
+    st.subheader("Comparação: (Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)")
+    df_comp_melt = compara_kpis(kpis_mensais, kpis_presenca, 'receitas', 'Receitas',
+                                'compras_mercadoria', 'Compras')
+    mostra_grafico(figura(grafico_por_tipo, df_comp_melt,
+                          '(Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)'))
+
+
+# Os arquivos só são gerados no clique (o botão recebe uma função) e ficam em
+# cache pela chave do arquivo carregado + filtros ativos.
+@st.fragment
+@medido("aba_exportacao")
+def aba_exportacao(indice, contas_ok, meses_selecionados, grupo_filtro, cubo, kpis_mensais, kpis_compilados,
+                   chave_exportacao):
+    st.subheader("Exportar Resumo")
+    st.download_button(
+        label="💾 Exportar Resumo para XLSX",
+        data=lambda: memoizado(f"{chave_exportacao}-resumo", lambda: resumo_xlsx(cubo)),
+        file_name='Resumo_ContaContabil.xlsx',
+        mime=MIME_XLSX,
+        on_click="ignore"
+    )
+
+    st.subheader("Exportar Razão Filtrado")
+    n_linhas = indice.n_linhas_filtradas(contas_ok, meses_selecionados, grupo_filtro)
+    # Acima do limite de linhas de uma planilha o XLSX sairia truncado
+    cabe_em_xlsx = n_linhas <= LIMITE_LINHAS_XLSX
+    formatos = [f for f in FORMATOS if cabe_em_xlsx or f != "XLSX"]
+    formato = st.radio("Formato:", formatos, horizontal=True)
+    if cabe_em_xlsx:
+        st.caption(f"{n_linhas} lançamentos. O XLSX inclui também as planilhas de Resumo e Indicadores; "
+                   "CSV e Parquet (recomendados para arquivos grandes) trazem só os lançamentos.")
+    else:
+        limite = f"{LIMITE_LINHAS_XLSX:,}".replace(",", ".")
+        st.caption(f"{n_linhas} lançamentos: acima do limite de {limite} linhas de uma planilha XLSX, "
+                   "o razão filtrado só pode ser exportado em CSV ou Parquet. Filtre menos meses ou "
+                   "contas para exportar em XLSX.")
+    indicadores = kpis_mensais.rename(columns=kpis_compilados.titulos)
+    extensao, mime = FORMATOS[formato]
+    st.download_button(
+        label=f"💾 Exportar Razão para {formato}",
+        data=lambda: memoizado(f"{chave_exportacao}-razao-{formato}", lambda: exporta_razao(
+            formato, indice.blocos(contas_ok, meses_selecionados, grupo_filtro), cubo, indicadores)),
+        file_name=f'Razao_Filtrado{extensao}',
+        mime=mime,
+        on_click="ignore"
+    )
 
 # ------------------------------------------------------------------------------
 # Processamento dos dados e cálculos (se houver dados)
 # ------------------------------------------------------------------------------
-if df is not None:
-    df['Valor'] = pd.to_numeric(df['Valor'], errors='coerce')
-    
-    total_entradas = df[df['Valor'] > 0]['Valor'].sum()
-    total_saidas = df[df['Valor'] < 0]['Valor'].sum()
-    saldo = total_entradas + total_saidas
-    total_compras_revenda = df[df['ContaContabil'] == 'Compras de Mercadoria para Revenda']['Valor'].sum()
-    total_das = df[df['ContaContabil'] == 'Impostos - DAS Simples Nacional']['Valor'].sum()
+if indice is not None:
+    # Todas as métricas abaixo saem do cubo mês x conta já filtrado
+    with etapa("cubo_filtrado", entrada=indice.n_linhas) as medicao:
+        cubo = indice.cubo_filtrado(contas_ok, meses_selecionados, grupo_filtro)
+        medicao.saida(int(cubo.quantidade.sum()))
+    with etapa("indicadores", entrada=int(cubo.quantidade.sum())) as medicao:
+        kpis_compilados = compila_para_cliente(cubo.contas, cliente_kpis)
+        kpis_mensais = calcula_kpis(cubo, kpis_compilados)
+        metricas = metricas_periodo(cubo, kpis_mensais)
+        medicao.saida(len(kpis_mensais))
     
     col1, col2, col3 = st.columns(3)
-    col1.metric("Entradas (R$) 💵", formata_valor_brasil(total_entradas))
-    col2.metric("Saídas (R$) 💸", formata_valor_brasil(abs(total_saidas)))
-    col3.metric("Saldo (R$) 💰", formata_valor_brasil(saldo))
+    col1.metric("Entradas (R$) 💵", formata_valor_brasil(metricas["entradas"]))
+    col2.metric("Saídas (R$) 💸", formata_valor_brasil(metricas["saidas"]))
+    col3.metric("Saldo (R$) 💰", formata_valor_brasil(metricas["saldo"]))
     
     col4, col5 = st.columns(2)
-    col4.metric("Compras de Mercadoria 🛒", formata_valor_brasil(total_compras_revenda))
-    col5.metric("Impostos (DAS) 🧾", formata_valor_brasil(total_das))
-    
-    required_cols = [
-        "Receita Vendas ML", 
-        "Receita Vendas SH", 
-        "Compras de Mercadoria para Revenda", 
-        "Taxa / Comissão / Fretes - makeplace", 
-        "Impostos - DAS Simples Nacional"
-    ]
-    for col in required_cols:
-        if col not in df.columns:
-            df[col] = 0
+    col4.metric("Compras de Mercadoria 🛒", formata_valor_brasil(metricas["compras_mercadoria"]))
+    col5.metric("Impostos (DAS) 🧾", formata_valor_brasil(metricas["impostos_das"]))
     
-    # Cálculo da Margem de Contribuição Ajustada por período:
-    # Fórmula: (Receita Vendas ML + Receita Vendas SH) - (|Compras de Mercadoria para Revenda| +
-    #         |Taxa / Comissão / Fretes - makeplace| + |Impostos - DAS Simples Nacional|)
-    def calc_contribuicao_ajustada(grupo):
-        receita_ml = grupo.loc[grupo["ContaContabil"] == "Receita Vendas ML", "Valor"].sum()
-        receita_sh = grupo.loc[grupo["ContaContabil"] == "Receita Vendas SH", "Valor"].sum()
-        total_receita = receita_ml + receita_sh
-        compras = grupo.loc[grupo["ContaContabil"] == "Compras de Mercadoria para Revenda", "Valor"].sum()
-        taxa = grupo.loc[grupo["ContaContabil"] == "Taxa / Comissão / Fretes - makeplace", "Valor"].sum()
-        impostos = grupo.loc[grupo["ContaContabil"] == "Impostos - DAS Simples Nacional", "Valor"].sum()
-        despesas = abs(compras) + abs(taxa) + abs(impostos)
-        return total_receita - despesas
-
-    df_contrib = df.groupby("Mês/Ano").apply(calc_contribuicao_ajustada).reset_index(name="Contribuição Ajustada")
-    
-    # Cria pivot para o gráfico de evolução
-    df_pivot = df.groupby(['Mês/Ano', 'ContaContabil'])['Valor'].sum().unstack(fill_value=0).reset_index()
-    # Cálculo da margem consolidada usando valor absoluto para as despesas
-    df_pivot["Contribuição Ajustada"] = (
-        df_pivot.get("Receita Vendas ML", 0) +
-        df_pivot.get("Receita Vendas SH", 0) -
-        (abs(df_pivot.get("Compras de Mercadoria para Revenda", 0)) +
-         abs(df_pivot.get("Taxa / Comissão / Fretes - makeplace", 0)) +
-         abs(df_pivot.get("Impostos - DAS Simples Nacional", 0)))
-    )
+    # Margem de Contribuição Ajustada por período
+    df_contrib = kpis_mensais['contribuicao_ajustada'].reset_index(name="Contribuição Ajustada")
     
     # ------------------------------
     # Card e Mini-Gráfico da Margem de Contribuição Ajustada
     # ------------------------------
-    valor_total_mc = df_contrib["Contribuição Ajustada"].sum()
-    idx_melhor = df_contrib["Contribuição Ajustada"].idxmax()
-    melhor_mes = df_contrib.loc[idx_melhor, "Mês/Ano"]
-    valor_melhor_mes = df_contrib.loc[idx_melhor, "Contribuição Ajustada"]
-    
-    valor_total_str = f"R$ {valor_total_mc:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    valor_melhor_mes_str = f"R$ {valor_melhor_mes:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    melhor_mes = metricas["melhor_mes"]
+    valor_total_str = formata_valor_brasil(metricas["contribuicao_ajustada"])
+    valor_melhor_mes_str = formata_valor_brasil(metricas["valor_melhor_mes"])
     
     st.markdown(
         f"""
@@ -204,285 +539,61 @@ if df is not None:
         unsafe_allow_html=True
     )
     
-    # Mini-gráfico (sparkline) da evolução da margem de contribuição ajustada, em Reais
-    fig_spark = px.line(
-        df_contrib,
-        x="Mês/Ano",
-        y="Contribuição Ajustada",
-        markers=True,
-        title=""
-    )
-    fig_spark.update_layout(
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        xaxis_title="",
-        yaxis_title="",
-        font=dict(color="#FFFFFF"),
-        height=150
-    )
-    fig_spark.update_traces(line_color="#FFFFFF")
-    fig_spark.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-    
-    st.plotly_chart(fig_spark, use_container_width=True)
-    
-    # ------------------------------
-    # Gráfico de Evolução da Margem de Contribuição Ajustada
-    # ------------------------------
-    fig_evol = go.Figure()
-    x_vals = df_pivot["Mês/Ano"]
-    contas = ["Receita Vendas ML", "Receita Vendas SH", 
-              "Compras de Mercadoria para Revenda", 
-              "Taxa / Comissão / Fretes - makeplace", 
-              "Impostos - DAS Simples Nacional"]
-    for conta in contas:
-        if conta in df_pivot.columns:
-            fig_evol.add_trace(
-                go.Scatter(
-                    x=x_vals,
-                    y=df_pivot[conta],
-                    mode="lines+markers",
-                    name=conta,
-                    line=dict(dash="dash")
-                )
-            )
-    fig_evol.add_trace(
-        go.Scatter(
-            x=x_vals,
-            y=df_pivot["Contribuição Ajustada"],
-            mode="lines+markers",
-            name="Contribuição Ajustada",
-            line=dict(dash="solid", width=3)
-        )
-    )
-    fig_evol.update_layout(
-        title="Evolução da Contribuição Ajustada (por Mês/Ano)",
-        yaxis_tickprefix="R$ ",
-        yaxis_tickformat=",.2f"
-    )
-    
-    # ------------------------------
-    # Novo Gráfico: Comparação (Receita Vendas ML+SH) vs (Compras de Mercadoria para Revenda)
-    # ------------------------------
-    st.subheader("Comparação: (Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)")
-    df_receitas = df[df['ContaContabil'].isin(['Receita Vendas ML', 'Receita Vendas SH'])]
-    df_receitas_mensal = df_receitas.groupby('Mês/Ano')['Valor'].sum().reset_index()
-    df_receitas_mensal.rename(columns={'Valor': 'Receitas'}, inplace=True)
-    
-    df_compras = df[df['ContaContabil'] == 'Compras de Mercadoria para Revenda']
-    df_compras_mensal = df_compras.groupby('Mês/Ano')['Valor'].sum().reset_index()
-    df_compras_mensal['Compras'] = df_compras_mensal['Valor'].abs()
-    df_compras_mensal.drop(columns=['Valor'], inplace=True)
-    
-    df_comp = pd.merge(df_receitas_mensal, df_compras_mensal, on='Mês/Ano', how='outer').fillna(0)
-    df_comp_melt = df_comp.melt(id_vars='Mês/Ano', value_vars=['Receitas', 'Compras'],
-                                var_name='Tipo', value_name='Valor')
-    
-    fig_comp2 = px.bar(
-        df_comp_melt,
-        x='Mês/Ano',
-        y='Valor',
-        color='Tipo',
-        barmode='group',
-        title='(Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)',
-        labels={'Valor': 'Valor (R$)'},
-        template='plotly_white'
-    )
-    fig_comp2.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
+    with etapa("sparkline", entrada=len(df_contrib)):
+        st.plotly_chart(figura(grafico_sparkline, df_contrib), use_container_width=True)
     
     # ------------------------------------------------------------------------------
-    # Abas do Dashboard
+    # Abas do Dashboard (só a aba aberta é executada)
     # ------------------------------------------------------------------------------
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 Resumo", "📄 Dados", "📈 Gráficos", "💾 Exportação"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Resumo", "📄 Dados", "📈 Gráficos", "💾 Exportação"],
+                                     key="aba", on_change="rerun")
     
     # ABA 1: Resumo por Conta Contábil
     with tab1:
-        st.markdown("<h2>Resumo por Conta Contábil</h2>", unsafe_allow_html=True)
-        resumo = df.groupby(['ContaContabil', 'Mês/Ano'])['Valor'].sum().reset_index()
-        resumo_pivot = resumo.pivot(index='ContaContabil', columns='Mês/Ano', values='Valor').fillna(0)
-        resumo_pivot['Total'] = resumo_pivot.sum(axis=1)
-        resumo_pivot.sort_values(by='Total', ascending=False, inplace=True)
-        total_geral = pd.DataFrame(resumo_pivot.sum(axis=0)).T
-        total_geral.index = ['Total Geral']
-        resumo_pivot = pd.concat([resumo_pivot, total_geral])
-        with st.container():
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.table(resumo_pivot.style.format(lambda x: formata_valor_brasil(x)))
-            st.markdown("</div>", unsafe_allow_html=True)
+        if tab1.open:
+            aba_resumo(cubo, kpis_mensais, kpis_compilados)
     
     # ABA 2: Dados
     with tab2:
-        st.markdown("<h2>Dados Importados</h2>", unsafe_allow_html=True)
-        df_sorted = df.sort_values(by='Valor', ascending=False)
-        with st.container():
-            st.markdown("<div class='data-container'>", unsafe_allow_html=True)
-            st.table(df_sorted.style.format({'Valor': lambda x: formata_valor_brasil(x)}))
-            st.markdown("</div>", unsafe_allow_html=True)
+        if tab2.open:
+            aba_dados(indice, contas_ok, meses_selecionados, grupo_filtro)
     
     # ABA 3: Gráficos
     with tab3:
-        st.subheader("Entradas (Valores Positivos)")
-        df_positivo = df[df['Valor'] > 0]
-        df_positivo_agrupado = df_positivo.groupby('ContaContabil')['Valor'].sum().reset_index()
-        if not df_positivo_agrupado.empty:
-            fig_entradas = px.bar(
-                df_positivo_agrupado,
-                x='ContaContabil',
-                y='Valor',
-                color='ContaContabil',
-                title='Entradas por Conta Contábil',
-                labels={'Valor': 'Valor (R$)'},
-                template='plotly_white'
-            )
-            fig_entradas.update_layout(xaxis_tickangle=-45)
-            fig_entradas.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-            with st.container():
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_entradas, use_container_width=True)
-                st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.write("Não há valores positivos para exibir.")
-    
-        st.subheader("Saídas (Valores Negativos)")
-        df_negativo = df[df['Valor'] < 0]
-        df_negativo_agrupado = df_negativo.groupby('ContaContabil')['Valor'].sum().abs().reset_index()
-        if not df_negativo_agrupado.empty:
-            top_5_saidas = df_negativo_agrupado.nlargest(5, 'Valor')
-            fig_saidas = px.bar(
-                top_5_saidas,
-                y='ContaContabil',
-                x='Valor',
-                orientation='h',
-                title='Top 5 Categorias de Saídas',
-                labels={'Valor': 'Valor (R$)', 'ContaContabil': 'Conta Contábil'},
-                template='plotly_white'
-            )
-            fig_saidas.update_layout(yaxis={'categoryorder': 'total ascending'})
-            fig_saidas.update_xaxes(tickprefix="R$ ", tickformat=",.2f")
-            with st.container():
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_saidas, use_container_width=True)
-                st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.write("Não há valores negativos para exibir.")
-    
-        st.subheader("Entradas x Saídas (por Mês/Ano)")
-        df_entradas_mensal = df[df['Valor'] > 0].groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_saidas_mensal = df[df['Valor'] < 0].groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_saidas_mensal['Valor'] = df_saidas_mensal['Valor'].abs()
-        df_entradas_mensal['Tipo'] = 'Entradas'
-        df_saidas_mensal['Tipo'] = 'Saídas'
-        df_dre = pd.concat([df_entradas_mensal, df_saidas_mensal], axis=0)
-        if not df_dre.empty:
-            fig_dre = px.bar(
-                df_dre,
-                x='Mês/Ano',
-                y='Valor',
-                color='Tipo',
-                barmode='group',
-                title='Entradas x Saídas (por Mês/Ano)',
-                labels={'Valor': 'Valor (R$)'},
-                template='plotly_white'
-            )
-            fig_dre.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-            with st.container():
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_dre, use_container_width=True)
-                st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.write("Não há dados suficientes para exibir o gráfico de Entradas x Saídas.")
-    
-        st.subheader("Evolução da Contribuição Ajustada (por Mês/Ano)")
-        with st.container():
-            st.plotly_chart(fig_evol, use_container_width=True)
-    
-        st.subheader("Comparação: (Receita Vendas ML + SH) vs (Impostos - DAS Simples Nacional)")
-        df_receitas = df[df['ContaContabil'].isin(['Receita Vendas ML', 'Receita Vendas SH'])]
-        df_receitas_mensal = df_receitas.groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_receitas_mensal.rename(columns={'Valor': 'Receitas'}, inplace=True)
-        df_impostos = df[df['ContaContabil'] == 'Impostos - DAS Simples Nacional'].copy()
-        df_impostos['Valor'] = df_impostos['Valor'].abs()
-        df_impostos_mensal = df_impostos.groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_impostos_mensal.rename(columns={'Valor': 'Impostos'}, inplace=True)
-        df_comparacao = pd.merge(df_receitas_mensal, df_impostos_mensal, on='Mês/Ano', how='outer').fillna(0)
-        if not df_comparacao.empty:
-            df_comparacao_melt = df_comparacao.melt(
-                id_vars='Mês/Ano',
-                value_vars=['Receitas','Impostos'],
-                var_name='Tipo',
-                value_name='Valor'
-            )
-            fig_comp = px.bar(
-                df_comparacao_melt,
-                x='Mês/Ano',
-                y='Valor',
-                color='Tipo',
-                barmode='group',
-                title='(Receita Vendas ML + SH) vs (Impostos - DAS Simples Nacional)',
-                labels={'Valor': 'Valor (R$)'},
-                template='plotly_white'
-            )
-            fig_comp.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-            with st.container():
-                st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-                st.plotly_chart(fig_comp, use_container_width=True)
-                st.markdown("</div>", unsafe_allow_html=True)
-        else:
-            st.write("Não há dados para gerar a comparação entre Receitas e Impostos (DAS).")
-    
-        # Exibe o gráfico de Comparação: (Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)
-        st.subheader("Comparação: (Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)")
-        df_receitas = df[df['ContaContabil'].isin(['Receita Vendas ML', 'Receita Vendas SH'])]
-        df_receitas_mensal = df_receitas.groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_receitas_mensal.rename(columns={'Valor': 'Receitas'}, inplace=True)
-        
-        df_compras = df[df['ContaContabil'] == 'Compras de Mercadoria para Revenda']
-        df_compras_mensal = df_compras.groupby('Mês/Ano')['Valor'].sum().reset_index()
-        df_compras_mensal['Compras'] = df_compras_mensal['Valor'].abs()
-        df_compras_mensal.drop(columns=['Valor'], inplace=True)
-        
-        df_comp = pd.merge(df_receitas_mensal, df_compras_mensal, on='Mês/Ano', how='outer').fillna(0)
-        df_comp_melt = df_comp.melt(id_vars='Mês/Ano', value_vars=['Receitas', 'Compras'],
-                                    var_name='Tipo', value_name='Valor')
-        
-        fig_comp2 = px.bar(
-            df_comp_melt,
-            x='Mês/Ano',
-            y='Valor',
-            color='Tipo',
-            barmode='group',
-            title='(Receita Vendas ML + SH) vs (Compras de Mercadoria para Revenda)',
-            labels={'Valor': 'Valor (R$)'},
-            template='plotly_white'
-        )
-        fig_comp2.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-        with st.container():
-            st.markdown("<div class='chart-container'>", unsafe_allow_html=True)
-            st.plotly_chart(fig_comp2, use_container_width=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+        if tab3.open:
+            aba_graficos(cubo, kpis_mensais, kpis_compilados)
     
     # ------------------------------------------------------------------------------
     # ABA 4: Exportação (arquivo XLSX)
     # ------------------------------------------------------------------------------
     with tab4:
-        st.subheader("Exportar Resumo")
-        resumo2 = df.groupby(['ContaContabil', 'Mês/Ano'])['Valor'].sum().reset_index()
-        resumo_pivot2 = resumo2.pivot(index='ContaContabil', columns='Mês/Ano', values='Valor').fillna(0)
-        resumo_pivot2['Total'] = resumo_pivot2.sum(axis=1)
-        resumo_pivot2.sort_values(by='Total', ascending=False, inplace=True)
-        total_geral = pd.DataFrame(resumo_pivot2.sum(axis=0)).T
-        total_geral.index = ['Total Geral']
-        resumo_pivot2 = pd.concat([resumo_pivot2, total_geral]).reset_index()
-        xlsx_data = convert_df_to_xlsx(resumo_pivot2)
-        st.download_button(
-            label="💾 Exportar Resumo para XLSX",
-            data=xlsx_data,
-            file_name='Resumo_ContaContabil.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        if tab4.open:
+            chave_exportacao = chave_filtros(chave, contas_ok, meses_selecionados, grupo_filtro, cliente_kpis)
+            aba_exportacao(indice, contas_ok, meses_selecionados, grupo_filtro, cubo, kpis_mensais,
+                           kpis_compilados, chave_exportacao)
 else:
     st.warning("Por favor, faça o upload de um arquivo Excel para começar.")
 
+# ------------------------------------------------------------------------------
+# Painel de desempenho (com DASHBOARD_INSTRUMENTACAO=1): etapas desta execução
+# do script. As reexecuções só de uma aba aparecem apenas nos logs.
+# ------------------------------------------------------------------------------
+if configuracao.INSTRUMENTACAO:
+    with st.sidebar.expander("⏱️ Desempenho (última execução)"):
+        registros = registros_da_execucao()
+        if registros:
+            painel = pd.DataFrame(registros)
+            st.caption(f"Total: {painel.loc[painel['nivel'] == 0, 'segundos'].sum() * 1000:.0f} ms")
+            st.dataframe(pd.DataFrame({
+                "Etapa": ["   " * n + ("↳ " if n else "") + e for n, e in zip(painel["nivel"], painel["etapa"])],
+                "Tempo (ms)": (painel["segundos"] * 1000).round(1),
+                "Linhas (entrada)": painel["linhas_entrada"].astype("Int64"),
+                "Linhas (saída)": painel["linhas_saida"].astype("Int64"),
+                "Memória (MB)": (painel["memoria_delta_bytes"].astype("float64") / 2**20).round(1),
+            }), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nenhuma etapa registrada nesta execução.")
+
 # ------------------------------------------------------------------------------
 # Footer personalizado
 # ------------------------------------------------------------------------------
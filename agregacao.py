@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from razao import rotulos_meses, une_categorias
+
+# ------------------------------------------------------------------------------
+# Cubo mês x conta.
+# Uma única passada sobre as linhas do razão soma os valores positivos e
+# negativos de cada par (mês, conta). Todos os cards, gráficos e tabelas do
+# dashboard (inclusive os KPIs, ver kpis.py) são derivados desse cubo, cujo
+# tamanho depende apenas do número de meses e contas distintos, e não do número
+# de lançamentos.
+# ------------------------------------------------------------------------------
+@dataclass
+class CuboMensal:
+    meses: np.ndarray       # códigos de mês (M), ordenados
+    contas: pd.Index        # nomes das contas (A), na ordem das categorias
+    positivo: np.ndarray    # M x A, soma dos valores > 0
+    negativo: np.ndarray    # M x A, soma dos valores < 0
+    quantidade: np.ndarray  # M x A, número de lançamentos
+
+    @property
+    def liquido(self):
+        return self.positivo + self.negativo
+
+    @property
+    def rotulos_meses(self):
+        return rotulos_meses(self.meses)
+
+    def coluna(self, conta):
+        if conta not in self.contas:
+            return np.zeros(len(self.meses))
+        return self.liquido[:, self.contas.get_loc(conta)]
+
+
+def monta_cubo(df):
+    contas = pd.Index(df["ContaContabil"].cat.categories)
+    codigos_conta = df["ContaContabil"].cat.codes.to_numpy()
+    codigos_mes = df["MesCodigo"].to_numpy()
+    valores = df["Valor"].to_numpy(dtype="float64")
+
+    validos = codigos_conta >= 0
+    codigos_conta = codigos_conta[validos]
+    codigos_mes = codigos_mes[validos]
+    valores = valores[validos]
+
+    # Meses compactados por contagem sobre o intervalo de códigos (sem ordenar
+    # as linhas): só os meses que têm lançamentos viram linhas do cubo.
+    primeiro_mes = int(codigos_mes.min()) if len(codigos_mes) else 0
+    deslocamento = codigos_mes.astype("int64") - primeiro_mes
+    presenca = np.bincount(deslocamento) > 0
+    meses = (np.flatnonzero(presenca) + primeiro_mes).astype("int32")
+    indice_mes = np.cumsum(presenca)[deslocamento] - 1 if len(deslocamento) else deslocamento
+
+    celula = indice_mes * len(contas) + codigos_conta
+    tamanho = len(meses) * len(contas)
+    forma = (len(meses), len(contas))
+    return CuboMensal(
+        meses=meses,
+        contas=contas,
+        positivo=np.bincount(celula, weights=np.where(valores > 0, valores, 0.0), minlength=tamanho).reshape(forma),
+        negativo=np.bincount(celula, weights=np.where(valores < 0, valores, 0.0), minlength=tamanho).reshape(forma),
+        quantidade=np.bincount(celula, minlength=tamanho).reshape(forma),
+    )
+
+
+# Cubo a partir de totais já agregados por (mês, conta), como os devolvidos por
+# um GROUP BY no banco de dados (ver banco.py). `contas` é a lista completa de
+# contas, na ordem das categorias; só os meses presentes viram linhas do cubo.
+def cubo_de_totais(totais, contas):
+    meses = np.unique(totais["mes"].to_numpy()).astype("int32")
+    forma = (len(meses), len(contas))
+    celulas = (np.searchsorted(meses, totais["mes"].to_numpy()), contas.get_indexer(totais["conta"]))
+    cubo = CuboMensal(meses=meses, contas=contas, positivo=np.zeros(forma), negativo=np.zeros(forma),
+                      quantidade=np.zeros(forma, dtype="int64"))
+    cubo.positivo[celulas] = totais["positivo"].to_numpy(dtype="float64")
+    cubo.negativo[celulas] = totais["negativo"].to_numpy(dtype="float64")
+    cubo.quantidade[celulas] = totais["quantidade"].to_numpy(dtype="int64")
+    return cubo
+
+
+# Cubo de várias planilhas a partir dos cubos de cada uma, sem voltar às linhas:
+# incluir uma planilha nova custa só o cubo dela. Meses e contas viram a união.
+def soma_cubos(cubos):
+    if len(cubos) == 1:
+        return cubos[0]
+    contas = pd.Index(une_categorias(*(cubo.contas for cubo in cubos)))
+    meses = np.unique(np.concatenate([cubo.meses for cubo in cubos])).astype("int32")
+    forma = (len(meses), len(contas))
+    soma = CuboMensal(meses=meses, contas=contas, positivo=np.zeros(forma), negativo=np.zeros(forma),
+                      quantidade=np.zeros(forma, dtype="int64"))
+    for cubo in cubos:
+        celulas = np.ix_(np.searchsorted(meses, cubo.meses), contas.get_indexer(cubo.contas))
+        soma.positivo[celulas] += cubo.positivo
+        soma.negativo[celulas] += cubo.negativo
+        soma.quantidade[celulas] += cubo.quantidade
+    return soma
+
+
+# ------------------------------------------------------------------------------
+# Métricas e tabelas derivadas do cubo
+# ------------------------------------------------------------------------------
+def resumo_por_conta(cubo):
+    presentes = cubo.quantidade.sum(axis=0) > 0
+    resumo = pd.DataFrame(
+        cubo.liquido[:, presentes].T,
+        index=pd.Index(cubo.contas[presentes], dtype=object),
+        columns=pd.Index(cubo.rotulos_meses, name='Mês/Ano'),
+    )
+    resumo['Total'] = resumo.sum(axis=1)
+    resumo.sort_values(by='Total', ascending=False, inplace=True)
+    total_geral = pd.DataFrame(resumo.sum(axis=0)).T
+    total_geral.index = ['Total Geral']
+    return pd.concat([resumo, total_geral])
+
+
+def totais_por_conta(cubo, sinal):
+    partes = cubo.positivo if sinal > 0 else cubo.negativo
+    totais = partes.sum(axis=0)
+    presentes = totais != 0
+    return pd.DataFrame({
+        'ContaContabil': cubo.contas[presentes].astype(object),
+        'Valor': np.abs(totais[presentes]),
+    })
+
+
+def entradas_saidas_mensal(cubo):
+    entradas = cubo.positivo.sum(axis=1)
+    saidas = np.abs(cubo.negativo.sum(axis=1))
+    rotulos = np.asarray(cubo.rotulos_meses, dtype=object)
+    return pd.concat([
+        pd.DataFrame({'Mês/Ano': rotulos[entradas != 0], 'Valor': entradas[entradas != 0], 'Tipo': 'Entradas'}),
+        pd.DataFrame({'Mês/Ano': rotulos[saidas != 0], 'Valor': saidas[saidas != 0], 'Tipo': 'Saídas'}),
+    ], axis=0)
+
+
+# Cubo restrito a um subconjunto de meses e contas, sem voltar às linhas do razão
+def recorta_cubo(cubo, meses_ok, contas_ok):
+    if meses_ok.all() and contas_ok.all():
+        return cubo
+    positivo = cubo.positivo[meses_ok] * contas_ok
+    negativo = cubo.negativo[meses_ok] * contas_ok
+    quantidade = cubo.quantidade[meses_ok] * contas_ok
+    com_dados = quantidade.sum(axis=1) > 0
+    return CuboMensal(
+        meses=cubo.meses[meses_ok][com_dados],
+        contas=cubo.contas,
+        positivo=positivo[com_dados],
+        negativo=negativo[com_dados],
+        quantidade=quantidade[com_dados],
+    )
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import configuracao
+from razao import normaliza_razao, rotulo_mes
+
+# ------------------------------------------------------------------------------
+# Armazém de lançamentos, só de acréscimo e particionado por mês.
+# Cada planilha importada é gravada uma única vez, identificada pelo hash do seu
+# conteúdo: as linhas são divididas por mês em <diretorio>/mes=AAAA-MM/<chave>.parquet
+# e o manifesto registra os meses, o número de linhas, os bytes em disco e o
+# último acesso de cada planilha. Uma planilha já presente nunca é lida de novo
+# do Excel nem regravada (a não ser que alguma partição dela se perca ou que
+# ela seja descartada). Quando o total passa de `limite_bytes`, as planilhas
+# usadas há mais tempo saem inteiras, com todas as suas partições. É a camada
+# em disco de cache_planilhas.carrega_planilha (interface get/put).
+# ------------------------------------------------------------------------------
+
+# Coluna interna com a posição original da linha na planilha
+COLUNA_LINHA = "_linha"
+
+
+class ArmazemRazao:
+    def __init__(self, diretorio, limite_bytes):
+        self.diretorio = diretorio
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+
+    def _caminho(self, mes, chave):
+        return os.path.join(self.diretorio, f"mes={rotulo_mes(mes)}", f"{chave}.parquet")
+
+    def _caminho_manifesto(self):
+        return os.path.join(self.diretorio, "manifesto.json")
+
+    def manifesto(self):
+        try:
+            with open(self._caminho_manifesto(), encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return {}
+
+    def _grava_manifesto(self, manifesto):
+        caminho = self._caminho_manifesto()
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump(manifesto, arquivo, indent=1)
+        os.replace(temporario, caminho)
+
+    # Razão normalizado da planilha `chave` (só os `meses` pedidos, se
+    # informados), na ordem original das linhas; None se ela não está no armazém
+    def get(self, chave, meses=None):
+        info = self.manifesto().get(chave)
+        if info is None:
+            return None
+        partes = []
+        for mes in info["meses"]:
+            if meses is not None and mes not in meses:
+                continue
+            try:
+                partes.append(pd.read_parquet(self._caminho(mes, chave)))
+            except Exception:
+                # Partição ausente ou corrompida: a planilha volta a ser lida
+                # do Excel e regravada
+                self._descarta(chave)
+                return None
+        if not partes:
+            return None
+        self._registra_acesso(chave)
+        df = pd.concat(partes, ignore_index=True)
+        df = df.sort_values(COLUNA_LINHA, kind="stable").drop(columns=COLUNA_LINHA).reset_index(drop=True)
+        return normaliza_razao(df)
+
+    def put(self, chave, df):
+        if self.limite_bytes <= 0 or chave in self.manifesto() or len(df) == 0:
+            return
+        codigos = df["MesCodigo"].to_numpy()
+        ordem = np.argsort(codigos, kind="stable")
+        meses, inicios = np.unique(codigos[ordem], return_index=True)
+        gravados = []
+        try:
+            for mes, inicio, fim in zip(meses, inicios, list(inicios[1:]) + [len(ordem)]):
+                posicoes = ordem[inicio:fim]
+                parte = df.take(posicoes).drop(columns="MesCodigo")
+                parte[COLUNA_LINHA] = posicoes
+                caminho = self._caminho(mes, chave)
+                os.makedirs(os.path.dirname(caminho), exist_ok=True)
+                gravados.append(caminho + ".tmp")
+                parte.to_parquet(caminho + ".tmp", index=False)
+                os.replace(caminho + ".tmp", caminho)
+                gravados[-1] = caminho
+        except Exception:
+            # Colunas com tipos mistos não são serializáveis em Parquet; nesse
+            # caso a planilha não entra no armazém
+            for caminho in gravados:
+                _remove(caminho)
+            return
+        with self._lock:
+            manifesto = self.manifesto()
+            manifesto[chave] = {"meses": [int(m) for m in meses], "linhas": len(df),
+                                "bytes": sum(os.path.getsize(caminho) for caminho in gravados),
+                                "acesso": time.time()}
+            self._aplica_limite(manifesto, chave)
+            self._grava_manifesto(manifesto)
+
+    def _registra_acesso(self, chave):
+        with self._lock:
+            manifesto = self.manifesto()
+            if chave in manifesto:
+                manifesto[chave]["acesso"] = time.time()
+                self._grava_manifesto(manifesto)
+
+    # Descarta as planilhas usadas há mais tempo (exceto `manter`, a recém-gravada)
+    # até o total caber no limite (com o lock)
+    def _aplica_limite(self, manifesto, manter):
+        for chave, info in manifesto.items():
+            if "bytes" not in info:
+                # Manifesto gravado antes do limite existir
+                info["bytes"] = sum(_tamanho(self._caminho(mes, chave)) for mes in info["meses"])
+        total = sum(info["bytes"] for info in manifesto.values())
+        antigas = sorted((info.get("acesso", 0), chave) for chave, info in manifesto.items() if chave != manter)
+        for _, chave in antigas:
+            if total <= self.limite_bytes:
+                break
+            info = manifesto.pop(chave)
+            for mes in info["meses"]:
+                _remove(self._caminho(mes, chave))
+            total -= info["bytes"]
+
+    def _descarta(self, chave):
+        with self._lock:
+            manifesto = self.manifesto()
+            info = manifesto.pop(chave, None)
+            if info is not None:
+                for mes in info["meses"]:
+                    _remove(self._caminho(mes, chave))
+                self._grava_manifesto(manifesto)
+
+
+def _tamanho(caminho):
+    try:
+        return os.path.getsize(caminho)
+    except OSError:
+        return 0
+
+
+def _remove(caminho):
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+
+armazem = ArmazemRazao(configuracao.DIRETORIO_ARMAZEM, configuracao.CACHE_DISCO_MB * 1024 * 1024)
@@ -0,0 +1,312 @@
+import functools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import configuracao
+from agregacao import cubo_de_totais
+from busca_contas import IndiceBuscaContas
+from cache_planilhas import hash_conteudo
+from filtros import FiltrosRazao
+from razao import une_categorias
+
+# ------------------------------------------------------------------------------
+# Banco de dados local (DuckDB ou SQLite) com os lançamentos de vários clientes.
+# Opcional (DASHBOARD_BACKEND=duckdb ou sqlite): os lançamentos ficam num
+# arquivo em disco, indexado por (cliente, mês, conta) e por (cliente, id), e
+# os filtros da barra lateral, o cubo mês x conta, as páginas da aba Dados e a
+# exportação viram consultas SQL; só os resultados (pequenos ou em blocos)
+# chegam ao pandas.
+# ------------------------------------------------------------------------------
+try:
+    import duckdb
+    DUCKDB_DISPONIVEL = True
+except ImportError:
+    DUCKDB_DISPONIVEL = False
+
+MOTORES = ("duckdb", "sqlite")
+
+TAMANHO_BLOCO = 50_000
+
+# Coluna do razão -> coluna da tabela de lançamentos
+COLUNAS_SQL = {"Data": "data", "ContaContabil": "conta", "Valor": "valor", "GrupoDeConta": "grupo"}
+
+TABELAS = [
+    """CREATE TABLE IF NOT EXISTS arquivos (
+        cliente TEXT NOT NULL,
+        chave TEXT NOT NULL,
+        nome TEXT,
+        ordem INTEGER NOT NULL,
+        linhas INTEGER NOT NULL,
+        PRIMARY KEY (cliente, chave)
+    )""",
+    # id = ordem do arquivo * 2^32 + linha na planilha (ordem original)
+    # data em microssegundos desde 1970-01-01
+    """CREATE TABLE IF NOT EXISTS lancamentos (
+        cliente TEXT NOT NULL,
+        id BIGINT NOT NULL,
+        mes INTEGER NOT NULL,
+        conta TEXT,
+        grupo TEXT,
+        data BIGINT,
+        valor DOUBLE
+    )""",
+    "CREATE INDEX IF NOT EXISTS lancamentos_cliente_mes_conta ON lancamentos (cliente, mes, conta)",
+    # Exportação: lançamentos do cliente na ordem original, sem ordenar a tabela
+    "CREATE INDEX IF NOT EXISTS lancamentos_cliente_id ON lancamentos (cliente, id)",
+]
+
+
+class BancoRazao:
+    def __init__(self, caminho, motor):
+        if motor not in MOTORES:
+            raise ValueError(f"Banco desconhecido: {motor!r} (use {' ou '.join(MOTORES)})")
+        if motor == "duckdb" and not DUCKDB_DISPONIVEL:
+            raise RuntimeError("DASHBOARD_BACKEND=duckdb requer o pacote duckdb (pip install duckdb)")
+        self.motor = motor
+        self._lock = threading.RLock()
+        if motor == "duckdb":
+            self._con = duckdb.connect(caminho)
+        else:
+            self._con = sqlite3.connect(caminho, check_same_thread=False)
+        with self._transacao():
+            for comando in TABELAS:
+                self._con.execute(comando)
+
+    @contextmanager
+    def _transacao(self):
+        with self._lock:
+            if self.motor == "sqlite":
+                with self._con:
+                    yield
+                return
+            self._con.execute("BEGIN TRANSACTION")
+            try:
+                yield
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+            self._con.execute("COMMIT")
+
+    def consulta(self, sql, parametros=()):
+        with self._lock:
+            if self.motor == "duckdb":
+                return self._con.execute(sql, list(parametros)).df()
+            return pd.read_sql_query(sql, self._con, params=list(parametros))
+
+    # Resultado de `sql` em DataFrames de até `tamanho` linhas, lidos aos poucos
+    # de uma única execução da consulta, num cursor próprio (que as demais
+    # consultas não interrompem). Sempre há ao menos um bloco, vazio se a
+    # consulta não retorna linhas.
+    def consulta_em_blocos(self, sql, parametros=(), tamanho=TAMANHO_BLOCO):
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            with self._lock:
+                cursor.execute(sql, list(parametros))
+            if self.motor == "duckdb":
+                yield from self._blocos_duckdb(cursor, tamanho)
+            else:
+                yield from self._blocos_sqlite(cursor, tamanho)
+        finally:
+            cursor.close()
+
+    def _blocos_duckdb(self, cursor, tamanho):
+        with self._lock:
+            lotes = cursor.fetch_record_batch(tamanho)
+        algum = False
+        while True:
+            with self._lock:
+                try:
+                    lote = lotes.read_next_batch()
+                except StopIteration:
+                    break
+            algum = True
+            yield lote.to_pandas()
+        if not algum:
+            yield lotes.schema.empty_table().to_pandas()
+
+    def _blocos_sqlite(self, cursor, tamanho):
+        colunas = [descricao[0] for descricao in cursor.description]
+        while True:
+            with self._lock:
+                linhas = cursor.fetchmany(tamanho)
+            yield pd.DataFrame.from_records(linhas, columns=colunas)
+            if len(linhas) < tamanho:
+                return
+
+    def clientes(self):
+        return self.consulta("SELECT DISTINCT cliente FROM arquivos ORDER BY cliente")["cliente"].tolist()
+
+    def arquivos(self, cliente):
+        return self.consulta("SELECT chave, nome, linhas FROM arquivos WHERE cliente = ? ORDER BY ordem", [cliente])
+
+    def contem(self, cliente, chave):
+        return len(self.consulta("SELECT 1 FROM arquivos WHERE cliente = ? AND chave = ?", [cliente, chave])) > 0
+
+    # Identifica o conjunto de planilhas do cliente (muda a cada importação);
+    # None se o cliente não tem nenhuma
+    def versao(self, cliente):
+        chaves = self.arquivos(cliente)["chave"].tolist()
+        if not chaves:
+            return None
+        return hash_conteudo(" ".join([cliente] + chaves).encode())
+
+    # Inclui o razão normalizado `df` (uma planilha) nos lançamentos do cliente.
+    # Uma planilha já importada para o cliente não é incluída de novo.
+    def importa(self, cliente, chave, nome, df):
+        with self._transacao():
+            if self.contem(cliente, chave):
+                return
+            ordem = int(self.consulta("SELECT COALESCE(MAX(ordem), -1) + 1 AS ordem FROM arquivos WHERE cliente = ?",
+                                      [cliente])["ordem"].iloc[0])
+            for inicio in range(0, len(df), TAMANHO_BLOCO):
+                self._insere(_lancamentos(cliente, ordem, df.iloc[inicio:inicio + TAMANHO_BLOCO], inicio))
+            self._con.execute("INSERT INTO arquivos VALUES (?, ?, ?, ?, ?)", [cliente, chave, nome, ordem, len(df)])
+
+    def _insere(self, tabela):
+        if self.motor == "duckdb":
+            self._con.register("novos_lancamentos", tabela)
+            self._con.execute("INSERT INTO lancamentos SELECT * FROM novos_lancamentos")
+            self._con.unregister("novos_lancamentos")
+        else:
+            linhas = tabela.astype(object).where(tabela.notna(), None).itertuples(index=False, name=None)
+            self._con.executemany("INSERT INTO lancamentos VALUES (?, ?, ?, ?, ?, ?, ?)", linhas)
+
+
+# Linhas da tabela de lançamentos para um bloco do razão que começa na linha
+# `inicio`. Ausentes (NaN/NaT) viram NULL.
+def _lancamentos(cliente, ordem, bloco, inicio):
+    sem_data = bloco["Data"].isna().to_numpy()
+    datas = pd.array(bloco["Data"].to_numpy().astype("datetime64[us]").astype("int64"), dtype="Int64")
+    datas[sem_data] = pd.NA
+    return pd.DataFrame({
+        "cliente": cliente,
+        "id": ordem * 2 ** 32 + np.arange(inicio, inicio + len(bloco), dtype="int64"),
+        "mes": bloco["MesCodigo"].to_numpy().astype("int64"),
+        "conta": _textos(bloco["ContaContabil"]),
+        "grupo": _textos(bloco["GrupoDeConta"]) if "GrupoDeConta" in bloco.columns else None,
+        "data": datas,
+        "valor": pd.array(bloco["Valor"].to_numpy(dtype="float64"), dtype="Float64"),
+    })
+
+
+def _textos(serie):
+    valores = serie.astype(object).to_numpy(copy=True)
+    valores[serie.isna().to_numpy()] = None
+    return valores
+
+
+@functools.lru_cache(maxsize=None)
+def abre_banco(motor=None, caminho=None):
+    motor = motor or configuracao.BACKEND
+    caminho = caminho or configuracao.ARQUIVO_BANCO or os.path.join(configuracao.DIRETORIO_CACHE, f"razao.{motor}")
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    return BancoRazao(caminho, motor)
+
+
+# ------------------------------------------------------------------------------
+# Consultas sobre os lançamentos de um cliente, com a mesma interface do
+# IndiceRazao (filtros.py). O cubo mês x conta completo vem de um GROUP BY e
+# fica em memória (tamanho meses x contas); filtros que não cabem no cubo, a
+# contagem, as páginas e a exportação vão ao banco.
+# ------------------------------------------------------------------------------
+class ConsultaRazao(FiltrosRazao):
+    def __init__(self, banco, cliente):
+        self.banco = banco
+        self.cliente = cliente
+        contas = banco.consulta("SELECT DISTINCT conta FROM lancamentos WHERE cliente = ? AND conta IS NOT NULL",
+                                [cliente])["conta"]
+        self.contas = pd.Index(une_categorias(contas))
+        self.busca_contas = IndiceBuscaContas(self.contas)
+        self.meses = np.sort(banco.consulta("SELECT DISTINCT mes FROM lancamentos WHERE cliente = ?",
+                                            [cliente])["mes"].to_numpy()).astype("int32")
+        self.n_linhas = self.n_linhas_filtradas(None, None)
+        self.cubo = self._cubo_nas_linhas(None, None, None)
+
+        pares = banco.consulta("SELECT DISTINCT conta, grupo FROM lancamentos "
+                               "WHERE cliente = ? AND conta IS NOT NULL", [cliente])
+        grupos = pares["grupo"].dropna()
+        self.grupos = None
+        self.grupo_da_conta = None
+        if len(grupos):
+            self.grupos = pd.Index(une_categorias(grupos))
+            if not pares["conta"].duplicated().any():
+                self.grupo_da_conta = np.full(len(self.contas), -1, dtype="int64")
+                self.grupo_da_conta[self.contas.get_indexer(pares["conta"])] = self.grupos.get_indexer(pares["grupo"])
+
+    # Cláusula WHERE (e parâmetros) para os filtros; None = sem filtro
+    def _onde(self, contas_ok, meses, grupo):
+        condicoes, parametros = ["cliente = ?"], [self.cliente]
+        if contas_ok is not None and not contas_ok.all():
+            selecionadas = list(self.contas[contas_ok])
+            condicoes.append(f"conta IN ({', '.join('?' * len(selecionadas))})" if selecionadas else "1 = 0")
+            parametros += selecionadas
+        if meses is not None and not np.isin(self.meses, meses).all():
+            selecionados = [int(m) for m in meses]
+            condicoes.append(f"mes IN ({', '.join('?' * len(selecionados))})" if selecionados else "1 = 0")
+            parametros += selecionados
+        if grupo is not None:
+            condicoes.append("grupo = ?")
+            parametros.append(grupo)
+        return " AND ".join(condicoes), parametros
+
+    def _grupos_nas_linhas(self, contas_ok, meses):
+        onde, parametros = self._onde(contas_ok, meses, None)
+        presentes = self.banco.consulta(f"SELECT DISTINCT grupo FROM lancamentos WHERE {onde} AND grupo IS NOT NULL",
+                                        parametros)["grupo"]
+        return self.grupos[self.grupos.isin(presentes)]
+
+    def _cubo_nas_linhas(self, contas_ok, meses, grupo):
+        onde, parametros = self._onde(contas_ok, meses, grupo)
+        totais = self.banco.consulta(
+            "SELECT mes, conta, "
+            "SUM(CASE WHEN valor > 0 THEN valor ELSE 0 END) AS positivo, "
+            "SUM(CASE WHEN valor < 0 THEN valor ELSE 0 END) AS negativo, "
+            "COUNT(*) AS quantidade "
+            f"FROM lancamentos WHERE {onde} AND conta IS NOT NULL GROUP BY mes, conta",
+            parametros,
+        )
+        return cubo_de_totais(totais, self.contas)
+
+    def n_linhas_filtradas(self, contas_ok, meses, grupo=None):
+        onde, parametros = self._onde(contas_ok, meses, grupo)
+        return int(self.banco.consulta(f"SELECT COUNT(*) AS n FROM lancamentos WHERE {onde}", parametros)["n"].iloc[0])
+
+    def pagina(self, contas_ok, meses, grupo, coluna, ascendente, pagina, tamanho):
+        onde, parametros = self._onde(contas_ok, meses, grupo)
+        direcao = "ASC" if ascendente else "DESC"
+        resultado = self.banco.consulta(
+            f"SELECT data, conta, valor, grupo, mes FROM lancamentos WHERE {onde} "
+            f"ORDER BY {COLUNAS_SQL[coluna]} {direcao} NULLS LAST, id LIMIT ? OFFSET ?",
+            parametros + [tamanho, (pagina - 1) * tamanho],
+        )
+        return self._razao(resultado)
+
+    # Linhas filtradas em blocos, na ordem original: uma única consulta ordenada
+    # por `id` (coberta pelo índice cliente, id), lida bloco a bloco
+    def blocos(self, contas_ok, meses, grupo=None, tamanho=TAMANHO_BLOCO):
+        onde, parametros = self._onde(contas_ok, meses, grupo)
+        primeiro = True
+        for resultado in self.banco.consulta_em_blocos(
+                f"SELECT data, conta, valor, grupo, mes FROM lancamentos WHERE {onde} ORDER BY id",
+                parametros, tamanho):
+            if len(resultado) or primeiro:
+                yield self._razao(resultado)
+            primeiro = False
+
+    # Resultado de uma consulta no formato do razão normalizado
+    def _razao(self, resultado):
+        razao = pd.DataFrame({
+            "Data": pd.to_datetime(resultado["data"].astype("Int64"), unit="us"),
+            "ContaContabil": pd.Categorical(resultado["conta"], categories=self.contas),
+            "Valor": resultado["valor"].astype("float64"),
+        })
+        if self.grupos is not None:
+            razao["GrupoDeConta"] = pd.Categorical(resultado["grupo"], categories=self.grupos)
+        razao["MesCodigo"] = resultado["mes"].to_numpy().astype("int32")
+        return razao
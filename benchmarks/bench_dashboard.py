@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from agregacao import entradas_saidas_mensal, resumo_por_conta, totais_por_conta
+from benchmarks.razao_sintetico import gera_razao, grava_planilha
+from exportacao import LIMITE_LINHAS_XLSX, razao_xlsx
+from filtros import IndiceRazao, ParteRazao
+from graficos import (
+    cache_figuras, figura, grafico_entradas, grafico_evolucao, grafico_por_tipo, grafico_sparkline, grafico_top_saidas,
+)
+from ingestao import _converte_bloco, _monta_df, le_razao
+from kpis import (
+    calcula_kpis, compara_kpis, compila_para_cliente, evolucao_kpi, metricas_periodo, presenca_kpis,
+)
+from razao import normaliza_razao
+
+# ------------------------------------------------------------------------------
+# Benchmark das etapas do dashboard sobre razões sintéticos
+# (benchmarks/razao_sintetico.py), do menor ao maior tamanho pedido.
+# Uso: python -m benchmarks.bench_dashboard [--linhas 10000 100000 1000000]
+#          [--etapas filtros graficos] [--salva]
+#
+# Cada etapa é medida `--repeticoes` vezes e vale o menor tempo. O resultado é
+# comparado com o baseline salvo (--baseline, padrão
+# benchmarks/resultados/baseline.json): etapas mais lentas que o baseline além
+# da tolerância aparecem como REGRESSÃO e o comando termina com erro. --salva
+# grava as medições desta execução como novo baseline.
+# ------------------------------------------------------------------------------
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados", "baseline.json")
+
+# Diferenças abaixo disso (em segundos) são ruído de medição
+RUIDO = 0.005
+
+
+def mede(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+# ------------------------------------------------------------------------------
+# Etapas. Cada uma recebe o contexto do tamanho sendo medido (razão bruto,
+# razão normalizado, índice, cubo, KPIs) e executa exatamente o que o
+# dashboard faz naquela etapa.
+# ------------------------------------------------------------------------------
+def etapa_ingestao(ctx):
+    le_razao(ctx["planilha"])
+
+
+# Conversão de datas (texto dd/mm/aaaa) e valores e normalização, sem o Excel
+def etapa_coercao(ctx):
+    bruto = ctx["bruto"]
+    bloco = _converte_bloco({c: bruto[c].tolist() for c in bruto.columns})
+    normaliza_razao(_monta_df(list(bruto.columns), [bloco]))
+
+
+def etapa_indice(ctx):
+    IndiceRazao(ctx["df"])
+
+
+# Conjunto com um mês a mais: só a parte do mês novo é indexada
+def etapa_mes_novo(ctx):
+    IndiceRazao([ctx["parte_historico"], ParteRazao(ctx["df_mes_novo"])])
+
+
+def etapa_filtro_contas(ctx):
+    indice = ctx["indice"]
+    contas_ok = np.arange(len(indice.contas)) % 2 == 0
+    indice.meses_com_lancamentos(contas_ok)
+    indice.cubo_filtrado(contas_ok, None)
+
+
+def etapa_filtro_meses(ctx):
+    indice = ctx["indice"]
+    indice.cubo_filtrado(ctx["todas"], list(indice.meses[::2]))
+
+
+def etapa_filtro_grupo(ctx):
+    indice = ctx["indice"]
+    grupos = indice.grupos_presentes(ctx["todas"], None)
+    contas_grupo = indice.contas_do_grupo(grupos[0])
+    if contas_grupo is not None:
+        indice.cubo_filtrado(contas_grupo, None)
+    else:
+        indice.cubo_filtrado(ctx["todas"], None, grupos[0])
+
+
+def etapa_filtro_texto(ctx):
+    indice = ctx["indice"]
+    indice.cubo_filtrado(indice.busca_contas.mascara("receita"), None)
+
+
+# Aba Dados: contagem e primeira página, ordenada por valor, com um mês a menos
+def etapa_pagina(ctx):
+    indice = ctx["indice"]
+    meses = list(indice.meses[1:])
+    indice.n_linhas_filtradas(ctx["todas"], meses)
+    indice.pagina(ctx["todas"], meses, None, "Valor", False, 1, 50)
+
+
+def etapa_contribuicao(ctx):
+    cubo = ctx["cubo"]
+    metricas_periodo(cubo, calcula_kpis(cubo, compila_para_cliente(cubo.contas)))
+
+
+def etapa_resumo(ctx):
+    resumo_por_conta(ctx["cubo"])
+
+
+def etapa_exportacao_xlsx(ctx):
+    indicadores = ctx["kpis"].rename(columns=ctx["compilado"].titulos)
+    razao_xlsx(ctx["indice"].blocos(ctx["todas"], None), ctx["cubo"], indicadores)
+
+
+# Todas as figuras do card da Contribuição Ajustada e da aba Gráficos, como o
+# dashboard as pede (por `figura`)
+def _graficos(ctx):
+    cubo, kpis, compilado = ctx["cubo"], ctx["kpis"], ctx["compilado"]
+    figura(grafico_sparkline, kpis["contribuicao_ajustada"].reset_index(name="Contribuição Ajustada"))
+    figura(grafico_entradas, totais_por_conta(cubo, sinal=1))
+    figura(grafico_top_saidas, totais_por_conta(cubo, sinal=-1))
+    figura(grafico_por_tipo, entradas_saidas_mensal(cubo), "Entradas x Saídas (por Mês/Ano)")
+    evolucao = evolucao_kpi(cubo, compilado, kpis, "contribuicao_ajustada")
+    figura(grafico_evolucao, evolucao, compilado.contas["contribuicao_ajustada"],
+           compilado.titulos["contribuicao_ajustada"])
+    presenca = presenca_kpis(cubo, compilado)
+    figura(grafico_por_tipo, compara_kpis(kpis, presenca, "receitas", "Receitas", "impostos_das_bruto", "Impostos"), "")
+    figura(grafico_por_tipo, compara_kpis(kpis, presenca, "receitas", "Receitas", "compras_mercadoria", "Compras"), "")
+
+
+# Primeira execução: as figuras são montadas
+def etapa_graficos(ctx):
+    cache_figuras.limpa()
+    _graficos(ctx)
+
+
+# Nova execução com os mesmos dados: as figuras vêm do cache de especificações
+def etapa_graficos_cache(ctx):
+    _graficos(ctx)
+
+
+ETAPAS = {
+    "ingestao": etapa_ingestao,
+    "coercao": etapa_coercao,
+    "indice": etapa_indice,
+    "mes_novo": etapa_mes_novo,
+    "filtro_contas": etapa_filtro_contas,
+    "filtro_meses": etapa_filtro_meses,
+    "filtro_grupo": etapa_filtro_grupo,
+    "filtro_texto": etapa_filtro_texto,
+    "pagina": etapa_pagina,
+    "contribuicao": etapa_contribuicao,
+    "resumo": etapa_resumo,
+    "exportacao_xlsx": etapa_exportacao_xlsx,
+    "graficos": etapa_graficos,
+    "graficos_cache": etapa_graficos_cache,
+}
+
+
+def prepara(linhas, contas, meses, diretorio, com_planilha):
+    bruto = gera_razao(linhas, contas, meses)
+    ctx = {"bruto": bruto}
+    if com_planilha:
+        ctx["planilha"] = os.path.join(diretorio, f"razao_{linhas}.xlsx")
+        grava_planilha(bruto, ctx["planilha"])
+    bloco = _converte_bloco({c: bruto[c].tolist() for c in bruto.columns})
+    ctx["df"] = normaliza_razao(_monta_df(list(bruto.columns), [bloco]))
+    ctx["indice"] = IndiceRazao(ctx["df"])
+    ultimo_mes = ctx["df"]["MesCodigo"] == ctx["df"]["MesCodigo"].max()
+    ctx["parte_historico"] = ParteRazao(ctx["df"][~ultimo_mes].reset_index(drop=True))
+    ctx["df_mes_novo"] = ctx["df"][ultimo_mes].reset_index(drop=True)
+    ctx["todas"] = np.ones(len(ctx["indice"].contas), dtype=bool)
+    ctx["cubo"] = ctx["indice"].cubo
+    ctx["compilado"] = compila_para_cliente(ctx["cubo"].contas)
+    ctx["kpis"] = calcula_kpis(ctx["cubo"], ctx["compilado"])
+    return ctx
+
+
+# ------------------------------------------------------------------------------
+# Baseline
+# ------------------------------------------------------------------------------
+def maquina():
+    return {"python": platform.python_version(), "sistema": platform.platform(),
+            "processador": platform.processor() or platform.machine(), "nucleos": os.cpu_count(),
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+
+def le_baseline(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def grava_baseline(caminho, anterior, resultados):
+    medicoes = dict(anterior["medicoes"]) if anterior else {}
+    for linhas, tempos in resultados.items():
+        medicoes.setdefault(str(linhas), {}).update(tempos)
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump({"maquina": maquina(), "data": time.strftime("%Y-%m-%d %H:%M:%S"), "medicoes": medicoes},
+                  arquivo, indent=1, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do dashboard com razões sintéticos.")
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="tamanhos do razão (ex.: 10000 100000 1000000 5000000)")
+    parser.add_argument("--contas", type=int, default=200)
+    parser.add_argument("--meses", type=int, default=24)
+    parser.add_argument("--etapas", nargs="+", choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--tolerancia", type=float, default=0.20,
+                        help="aumento relativo de tempo tolerado antes de acusar regressão")
+    parser.add_argument("--salva", action="store_true", help="grava as medições como novo baseline")
+    args = parser.parse_args()
+
+    baseline = le_baseline(args.baseline)
+    if baseline and baseline["maquina"] != maquina():
+        print(f"Aviso: baseline medido em outro ambiente ({baseline['maquina']}).")
+
+    resultados = {}
+    regressoes = 0
+    print(f"{'linhas':>10}  {'etapa':<16}{'tempo (s)':>11}{'baseline':>11}{'variação':>10}")
+    with tempfile.TemporaryDirectory() as diretorio:
+        for linhas in sorted(args.linhas):
+            etapas = list(args.etapas)
+            if linhas > LIMITE_LINHAS_XLSX:
+                # Não cabe numa planilha XLSX: a leitura e a exportação XLSX não
+                # são medidas nesse tamanho
+                etapas = [e for e in etapas if e not in ("ingestao", "exportacao_xlsx")]
+            com_planilha = "ingestao" in etapas
+            ctx = prepara(linhas, args.contas, args.meses, diretorio, com_planilha)
+            resultados[linhas] = {}
+            anteriores = (baseline or {}).get("medicoes", {}).get(str(linhas), {})
+            for etapa in etapas:
+                tempo = mede(lambda: ETAPAS[etapa](ctx), args.repeticoes)
+                resultados[linhas][etapa] = tempo
+                linha = f"{linhas:>10,}  {etapa:<16}{tempo:>11.4f}"
+                if etapa in anteriores:
+                    variacao = tempo / anteriores[etapa] - 1 if anteriores[etapa] else 0.0
+                    linha += f"{anteriores[etapa]:>11.4f}{variacao:>+10.0%}"
+                    if variacao > args.tolerancia and tempo - anteriores[etapa] > RUIDO:
+                        linha += "  REGRESSÃO"
+                        regressoes += 1
+                print(linha, flush=True)
+            del ctx
+
+    if args.salva:
+        grava_baseline(args.baseline, baseline, resultados)
+        print(f"Baseline gravado em {args.baseline}")
+    if regressoes:
+        print(f"{regressoes} etapa(s) mais lenta(s) que o baseline (tolerância {args.tolerancia:.0%}).")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
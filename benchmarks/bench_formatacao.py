@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from formatacao import formata_valor_brasil
+
+# ------------------------------------------------------------------------------
+# Micro-benchmark da formatação em Reais: implementação anterior (f-string por
+# célula, como era chamada via Styler.format) contra a versão vetorizada.
+# Uso: python -m benchmarks.bench_formatacao [--linhas 1000000]
+# ------------------------------------------------------------------------------
+def formata_valor_brasil_anterior(valor):
+    if pd.isnull(valor):
+        return ""
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def gera_valores(linhas, semente=0):
+    rng = np.random.default_rng(semente)
+    valores = np.round(rng.lognormal(mean=7, sigma=2.5, size=linhas), 2)
+    valores *= rng.choice([-1, 1], size=linhas)
+    valores[rng.random(linhas) < 0.01] = np.nan
+    return valores
+
+
+def mede(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a formatação em Reais anterior com a vetorizada.")
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    serie = pd.Series(gera_valores(args.linhas))
+    tempo_anterior, anterior = mede(lambda: serie.map(formata_valor_brasil_anterior), args.repeticoes)
+    tempo_vetorizado, vetorizado = mede(lambda: formata_valor_brasil(serie), args.repeticoes)
+
+    divergencias = int((anterior.to_numpy() != vetorizado.to_numpy()).sum())
+    print(f"linhas: {args.linhas:,}")
+    print(f"anterior:   {tempo_anterior:8.3f} s  ({tempo_anterior / args.linhas * 1e9:7.1f} ns/célula)")
+    print(f"vetorizado: {tempo_vetorizado:8.3f} s  ({tempo_vetorizado / args.linhas * 1e9:7.1f} ns/célula)")
+    print(f"ganho:      {tempo_anterior / tempo_vetorizado:8.1f}x")
+    print(f"divergências: {divergencias}")
+
+
+if __name__ == "__main__":
+    main()
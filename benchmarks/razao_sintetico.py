@@ -0,0 +1,98 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from exportacao import LIMITE_LINHAS_XLSX
+from kpis import PADRAO, carrega_definicoes
+
+# ------------------------------------------------------------------------------
+# Gerador de razões sintéticos no formato lido pelo dashboard
+# (Data / ContaContabil / Valor / GrupoDeConta), para medir como ele escala.
+# Sempre inclui as contas usadas pelos KPIs padrão do kpis.json (receitas,
+# compras, DAS, taxas do marketplace), de forma que a Contribuição Ajustada e
+# os demais indicadores têm valores; as demais contas são "Conta 0001", ...
+# Uso: python -m benchmarks.razao_sintetico razao.xlsx [--linhas 100000]
+# ------------------------------------------------------------------------------
+
+GRUPOS_EXTRAS = ["Despesas", "Despesas Financeiras", "Receitas Financeiras", "Ativo"]
+
+
+# Contas que aparecem nas definições padrão dos KPIs, com o grupo de cada uma
+def contas_dos_kpis():
+    contas = {}
+    for kpi in carrega_definicoes().get(PADRAO, {}).values():
+        for termo in kpi["termos"]:
+            contas.setdefault(termo["conta"], "Receitas" if termo["conta"].startswith("Receita") else "Despesas")
+    return contas
+
+
+# DataFrame bruto (como sai do Excel) com `linhas` lançamentos espalhados por
+# `meses` meses a partir de `inicio` e `contas` contas (no mínimo as dos KPIs).
+# Com `datas_texto`, as datas vêm como texto dd/mm/aaaa, como nas planilhas
+# exportadas pelos sistemas contábeis; senão, como datas do Excel.
+def gera_razao(linhas, contas=50, meses=12, inicio="2023-01", semente=0, datas_texto=True):
+    rng = np.random.default_rng(semente)
+    especiais = contas_dos_kpis()
+    nomes = list(especiais) + [f"Conta {i:04d}" for i in range(1, max(contas - len(especiais), 0) + 1)]
+    grupos = np.array(list(especiais.values())
+                      + list(rng.choice(GRUPOS_EXTRAS, size=len(nomes) - len(especiais))), dtype=object)
+
+    # Frequência das contas em cauda longa; as dos KPIs ficam entre as mais usadas
+    pesos = 1.0 / np.arange(1, len(nomes) + 1) ** 0.8
+    codigos_conta = rng.choice(len(nomes), size=linhas, p=pesos / pesos.sum())
+
+    dias = pd.date_range(pd.Period(inicio, "M").start_time, periods=meses, freq="MS")
+    dias = pd.date_range(dias[0], dias[-1] + pd.offsets.MonthEnd(0), freq="D")
+    codigos_dia = rng.integers(0, len(dias), size=linhas)
+    if datas_texto:
+        datas = dias.strftime("%d/%m/%Y").to_numpy(dtype=object)[codigos_dia]
+    else:
+        datas = dias.to_numpy()[codigos_dia]
+
+    receita = np.char.startswith(grupos.astype(str), "Receita")[codigos_conta]
+    valores = np.round(rng.lognormal(mean=7.2, sigma=1.0, size=linhas), 2)
+    # Lançamentos no sentido contrário (estornos, devoluções) em ~2% das linhas
+    sinal = np.where(receita, 1.0, -1.0) * np.where(rng.random(linhas) < 0.02, -1.0, 1.0)
+
+    return pd.DataFrame({
+        "Data": datas,
+        "ContaContabil": np.array(nomes, dtype=object)[codigos_conta],
+        "Valor": valores * sinal,
+        "GrupoDeConta": grupos[codigos_conta],
+    })
+
+
+# Grava o razão numa planilha XLSX (modo de memória constante do xlsxwriter)
+def grava_planilha(df, caminho):
+    if len(df) > LIMITE_LINHAS_XLSX:
+        raise ValueError(f"Uma planilha XLSX comporta no máximo {LIMITE_LINHAS_XLSX:,} lançamentos.")
+    pasta = xlsxwriter.Workbook(caminho, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"})
+    planilha = pasta.add_worksheet("Razão")
+    planilha.write_row(0, 0, list(df.columns))
+    colunas = [df[c].to_numpy(dtype=object) for c in df.columns]
+    if pd.api.types.is_datetime64_any_dtype(df["Data"]):
+        colunas[0] = np.array(df["Data"].dt.to_pydatetime(), dtype=object)
+    for linha, valores in enumerate(zip(*colunas), start=1):
+        planilha.write_row(linha, 0, valores)
+    pasta.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um razão contábil sintético em XLSX.")
+    parser.add_argument("saida", help="arquivo .xlsx a gerar")
+    parser.add_argument("--linhas", type=int, default=100_000)
+    parser.add_argument("--contas", type=int, default=50)
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--inicio", default="2023-01", help="primeiro mês (AAAA-MM)")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--datas-excel", action="store_true", help="datas como células de data, e não texto")
+    args = parser.parse_args()
+    df = gera_razao(args.linhas, args.contas, args.meses, args.inicio, args.semente, not args.datas_excel)
+    grava_planilha(df, args.saida)
+    print(f"{len(df):,} lançamentos gravados em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
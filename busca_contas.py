@@ -0,0 +1,59 @@
+import bisect
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# Busca textual sobre os nomes distintos de conta.
+# Os nomes são normalizados uma vez (minúsculas, sem acentos) e indexados por
+# trigramas e em ordem alfabética (para busca por prefixo). Cada consulta só
+# olha o pequeno conjunto de contas distintas, nunca as linhas do razão.
+# ------------------------------------------------------------------------------
+def normaliza_texto(texto):
+    decomposto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).casefold()
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceBuscaContas:
+    def __init__(self, nomes):
+        self.normalizados = [normaliza_texto(nome) for nome in nomes]
+        self.ordenados = sorted((nome, i) for i, nome in enumerate(self.normalizados))
+        self._chaves_ordenadas = [nome for nome, _ in self.ordenados]
+        trigramas = defaultdict(list)
+        for i, nome in enumerate(self.normalizados):
+            for trigrama in _trigramas(nome):
+                trigramas[trigrama].append(i)
+        self.trigramas = {t: np.array(contas, dtype="int64") for t, contas in trigramas.items()}
+
+    # Máscara sobre as contas cujo nome contém `consulta` (ou começa com ela, se
+    # `prefixo`), ignorando maiúsculas e acentos
+    def mascara(self, consulta, prefixo=False):
+        encontradas = np.zeros(len(self.normalizados), dtype=bool)
+        encontradas[self.busca(consulta, prefixo)] = True
+        return encontradas
+
+    def busca(self, consulta, prefixo=False):
+        consulta = normaliza_texto(consulta)
+        if not consulta:
+            return np.arange(len(self.normalizados))
+        if prefixo:
+            inicio = bisect.bisect_left(self._chaves_ordenadas, consulta)
+            fim = bisect.bisect_left(self._chaves_ordenadas, consulta + "\U0010ffff")
+            return np.sort([i for _, i in self.ordenados[inicio:fim]]).astype("int64")
+        if len(consulta) < 3:
+            candidatas = range(len(self.normalizados))
+        else:
+            # Só contas que têm todos os trigramas da consulta podem conter o texto
+            listas = sorted((self.trigramas.get(t) for t in _trigramas(consulta)),
+                            key=lambda contas: -1 if contas is None else len(contas))
+            if listas[0] is None:
+                return np.array([], dtype="int64")
+            candidatas = listas[0]
+            for contas in listas[1:]:
+                candidatas = np.intersect1d(candidatas, contas, assume_unique=True)
+        return np.array([i for i in candidatas if consulta in self.normalizados[i]], dtype="int64")
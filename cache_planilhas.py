@@ -0,0 +1,179 @@
+import hashlib
+import io
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+import configuracao
+
+# ------------------------------------------------------------------------------
+# Cache de planilhas lidas, indexado pelo hash do conteúdo do arquivo.
+# Em disco: o armazém particionado por mês (armazem.py, com LRU por planilha).
+# Em memória: os conjuntos de dados montados (razão + índices de filtro), num
+# cache do processo compartilhado entre as sessões (CacheCompartilhado). É a
+# única cópia do razão mantida em memória, de forma que o limite desse cache é
+# o orçamento de memória dos dados carregados.
+# ------------------------------------------------------------------------------
+def hash_conteudo(dados):
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+def tamanho_df(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+# `tamanho` mede quantos bytes cada item ocupa (DataFrames por padrão)
+class CacheMemoria:
+    def __init__(self, limite_bytes, tamanho=tamanho_df):
+        self.limite_bytes = limite_bytes
+        self.tamanho = tamanho
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def __contains__(self, chave):
+        return chave in self._itens
+
+    def get(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+            self._itens.move_to_end(chave)
+            return item[0]
+
+    def put(self, chave, item):
+        tamanho = self.tamanho(item)
+        if tamanho > self.limite_bytes:
+            return
+        with self._lock:
+            if chave in self._itens:
+                self._bytes -= self._itens.pop(chave)[1]
+            self._itens[chave] = (item, tamanho)
+            self._bytes += tamanho
+            self._aplica_limite()
+
+    # Remove os itens usados há mais tempo até caber no limite (com o lock)
+    def _aplica_limite(self):
+        while self._bytes > self.limite_bytes and self._itens:
+            _, (_, tamanho_removido) = self._itens.popitem(last=False)
+            self._bytes -= tamanho_removido
+
+    def limpa(self):
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def estatisticas(self):
+        with self._lock:
+            return {"itens": len(self._itens), "bytes": self._bytes, "limite_bytes": self.limite_bytes,
+                    "acertos": self.acertos, "falhas": self.falhas}
+
+
+# Cache de conjuntos de dados somente leitura, compartilhado pelas sessões do
+# processo: quem abre o mesmo arquivo usa o mesmo objeto, em vez de cada sessão
+# guardar sua própria cópia. Cada sessão segura uma Reserva do conjunto que está
+# usando; conjuntos reservados nunca são descartados, e os demais saem por LRU
+# quando os bytes passam do limite. Quem usa um conjunto não pode alterá-lo.
+class CacheCompartilhado(CacheMemoria):
+    def __init__(self, limite_bytes, tamanho=tamanho_df):
+        super().__init__(limite_bytes, tamanho)
+        self._referencias = {}
+        self._montando = {}
+
+    # Reserva o conjunto `chave`, montado por `monta()` se ainda não estiver no
+    # cache. Duas sessões pedindo o mesmo conjunto ao mesmo tempo esperam uma
+    # única montagem.
+    def reserva(self, chave, monta):
+        item = self._adquire(chave)
+        if item is None:
+            with self._lock:
+                trava = self._montando.setdefault(chave, threading.Lock())
+            with trava:
+                try:
+                    item = self._adquire(chave)
+                    if item is None:
+                        item = monta()
+                        with self._lock:
+                            self.falhas += 1
+                            self._itens[chave] = (item, self.tamanho(item))
+                            self._bytes += self._itens[chave][1]
+                            self._referencias[chave] = self._referencias.get(chave, 0) + 1
+                            self._aplica_limite()
+                finally:
+                    # Mesmo se `monta()` falhar, a trava da montagem não fica para trás
+                    with self._lock:
+                        self._montando.pop(chave, None)
+        return Reserva(self, chave, item)
+
+    def _adquire(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            self.acertos += 1
+            self._itens.move_to_end(chave)
+            self._referencias[chave] = self._referencias.get(chave, 0) + 1
+            return item[0]
+
+    def libera(self, chave):
+        with self._lock:
+            restantes = self._referencias.get(chave, 0) - 1
+            if restantes > 0:
+                self._referencias[chave] = restantes
+            else:
+                self._referencias.pop(chave, None)
+            self._aplica_limite()
+
+    def _aplica_limite(self):
+        livres = [c for c in self._itens if c not in self._referencias]
+        for chave in livres:
+            if self._bytes <= self.limite_bytes:
+                break
+            self._bytes -= self._itens.pop(chave)[1]
+
+    def estatisticas(self):
+        estatisticas = super().estatisticas()
+        with self._lock:
+            estatisticas["em_uso"] = len(self._referencias)
+            estatisticas["reservas"] = sum(self._referencias.values())
+        return estatisticas
+
+
+# Conjunto reservado por uma sessão. A reserva é desfeita por `libera()` ou,
+# quando a sessão termina, junto com o objeto.
+class Reserva:
+    def __init__(self, cache, chave, item):
+        self.chave = chave
+        self.item = item
+        self._finalizador = weakref.finalize(self, cache.libera, chave)
+
+    def libera(self):
+        self._finalizador()
+
+
+# Conjuntos em uso pelas sessões (itens com método `tamanho()`, ver filtros.IndiceRazao)
+cache_conjuntos = CacheCompartilhado(configuracao.CACHE_CONJUNTOS_MB * 1024 * 1024,
+                                     tamanho=lambda conjunto: conjunto.tamanho())
+
+# Retorna (chave, df) para o conteúdo do arquivo, lendo o Excel só se necessário.
+# O DataFrame não fica guardado em memória aqui: quem o usa (o conjunto montado
+# pelo dashboard) é que fica no cache, dentro do orçamento.
+# `versao` identifica o formato produzido pelo leitor: mudar a versão invalida
+# as entradas antigas sem precisar limpar o diretório de cache. `disco` é a
+# camada persistente (qualquer objeto com get/put, como o armazem.ArmazemRazao;
+# None = sem camada em disco).
+def carrega_planilha(dados, leitor=pd.read_excel, versao="", disco=None):
+    chave = hash_conteudo(dados)
+    chave_cache = f"{chave}-v{versao}" if versao else chave
+    df = None if disco is None else disco.get(chave_cache)
+    if df is None:
+        df = leitor(io.BytesIO(dados))
+        if disco is not None:
+            disco.put(chave_cache, df)
+    return chave, df
@@ -0,0 +1,46 @@
+import os
+
+# ------------------------------------------------------------------------------
+# Configurações do dashboard (lidas de variáveis de ambiente)
+# ------------------------------------------------------------------------------
+def _env_int(nome, padrao):
+    valor = os.environ.get(nome)
+    if valor is None or valor.strip() == "":
+        return padrao
+    return int(valor)
+
+# Diretório local onde ficam os caches em disco
+DIRETORIO_CACHE = os.environ.get("DASHBOARD_CACHE_DIR", ".cache_dashboard")
+
+# Limite do armazém em disco das planilhas já lidas (armazem.py; as planilhas
+# usadas há mais tempo saem primeiro), em MB
+CACHE_DISCO_MB = _env_int("DASHBOARD_CACHE_DISCO_MB", 2048)
+
+# Orçamento de memória do processo para os conjuntos de dados abertos, que são
+# compartilhados entre as sessões (em MB). Somado aos caches de exportações e de
+# gráficos, abaixo, é o limite de memória dos caches do dashboard.
+CACHE_CONJUNTOS_MB = _env_int("DASHBOARD_CACHE_CONJUNTOS_MB", 2048)
+
+# Armazém (só de acréscimo, particionado por mês) das planilhas já importadas
+DIRETORIO_ARMAZEM = os.environ.get("DASHBOARD_ARMAZEM_DIR", os.path.join(DIRETORIO_CACHE, "armazem"))
+
+# Onde ficam os lançamentos: "memoria" (padrão, DataFrame na sessão) ou num banco
+# local "duckdb" / "sqlite", para razões grandes ou de vários clientes
+BACKEND = os.environ.get("DASHBOARD_BACKEND", "memoria").strip().lower()
+# Arquivo do banco local (padrão: <DIRETORIO_CACHE>/razao.<backend>)
+ARQUIVO_BANCO = os.environ.get("DASHBOARD_BANCO", "")
+
+# Limite do cache em memória dos arquivos exportados (em MB)
+CACHE_EXPORTACAO_MB = _env_int("DASHBOARD_CACHE_EXPORTACAO_MB", 256)
+
+# Limite do cache em memória das especificações (JSON) dos gráficos (em MB)
+CACHE_FIGURAS_MB = _env_int("DASHBOARD_CACHE_FIGURAS_MB", 64)
+
+# Registra tempo, linhas e memória de cada etapa do dashboard (logs JSON e painel
+# de desempenho na barra lateral): 1 liga, 0 (padrão) desliga
+INSTRUMENTACAO = _env_int("DASHBOARD_INSTRUMENTACAO", 0) == 1
+
+# Arquivo com as definições declarativas dos KPIs (padrão e por cliente)
+ARQUIVO_KPIS = os.environ.get(
+    "DASHBOARD_KPIS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "kpis.json")
+)
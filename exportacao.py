@@ -0,0 +1,164 @@
+import hashlib
+import io
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+import configuracao
+from agregacao import resumo_por_conta
+from cache_planilhas import CacheMemoria
+from instrumentacao import etapa, medido
+from razao import com_rotulo_mes
+
+# ------------------------------------------------------------------------------
+# Exportação de arquivos.
+# Os bytes de cada exportação são gerados só quando pedidos (clique no botão) e
+# guardados em memória pela chave "arquivo carregado + estado dos filtros", de
+# forma que pedir de novo o mesmo arquivo não refaz nada.
+# O razão completo chega em blocos (ver `blocos` em filtros.py e banco.py) e é
+# escrito direto num arquivo temporário (XLSX em modo de memória constante, CSV
+# ou Parquet por grupos de linhas), sem montar cópias do razão filtrado.
+# ------------------------------------------------------------------------------
+MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Formato -> (extensão, tipo MIME)
+FORMATOS = {
+    "XLSX": (".xlsx", MIME_XLSX),
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+# Uma planilha XLSX tem no máximo 1.048.576 linhas (uma é o cabeçalho); acima
+# disso o razão só é exportado em CSV ou Parquet
+LIMITE_LINHAS_XLSX = 1_048_575
+
+cache_exportacoes = CacheMemoria(configuracao.CACHE_EXPORTACAO_MB * 1024 * 1024, tamanho=len)
+
+
+# Identifica o arquivo carregado e o estado de todos os filtros aplicados
+def chave_filtros(chave_arquivo, contas_ok, meses, grupo=None, cliente=None):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(chave_arquivo).encode())
+    h.update(len(contas_ok).to_bytes(8, "little"))
+    h.update(np.packbits(contas_ok).tobytes())
+    h.update(repr(None if meses is None else [int(m) for m in meses]).encode())
+    h.update(repr((grupo, cliente)).encode())
+    return h.hexdigest()
+
+
+# Bytes da exportação `chave`, gerados por `gera()` apenas na primeira vez
+def memoizado(chave, gera):
+    dados = cache_exportacoes.get(chave)
+    if dados is None:
+        dados = gera()
+        cache_exportacoes.put(chave, dados)
+    return dados
+
+
+@medido("exportacao_resumo")
+def resumo_xlsx(cubo):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        resumo_por_conta(cubo).reset_index().to_excel(writer, index=False, sheet_name='Resumo')
+    return output.getvalue()
+
+
+# Blocos de linhas do razão com o código de mês trocado pelo rótulo Mês/Ano
+def _com_rotulos(blocos):
+    for bloco in blocos:
+        yield com_rotulo_mes(bloco)
+
+
+# Gera o arquivo num diretório temporário e devolve seu conteúdo (uma única cópia)
+def _em_arquivo_temporario(extensao, escreve):
+    with tempfile.TemporaryDirectory() as diretorio:
+        caminho = os.path.join(diretorio, f"exportacao{extensao}")
+        escreve(caminho)
+        with open(caminho, "rb") as arquivo:
+            return arquivo.read()
+
+
+def razao_csv(blocos):
+    def escreve(caminho):
+        with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+            for i, bloco in enumerate(_com_rotulos(blocos)):
+                bloco.to_csv(arquivo, index=False, header=(i == 0))
+    return _em_arquivo_temporario(".csv", escreve)
+
+
+def razao_parquet(blocos):
+    def escreve(caminho):
+        escritor = None
+        try:
+            for bloco in _com_rotulos(blocos):
+                tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+                if escritor is None:
+                    escritor = pq.ParquetWriter(caminho, tabela.schema)
+                escritor.write_table(tabela)
+        finally:
+            if escritor is not None:
+                escritor.close()
+    return _em_arquivo_temporario(".parquet", escreve)
+
+
+# Valores prontos para o xlsxwriter: ausentes (NaN/NaT) viram None (célula vazia)
+def _valores_celulas(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        valores = np.array(serie.dt.to_pydatetime(), dtype=object)
+    else:
+        valores = serie.to_numpy(dtype=object)
+    valores[serie.isna().to_numpy()] = None
+    return valores
+
+
+# Escreve `df` a partir da linha `linha` (com cabeçalho, se pedido) e devolve a
+# próxima linha livre. O xlsxwriter ignora (retorna -1) linhas além do limite
+# da planilha; isso vira erro em vez de um arquivo truncado.
+def _escreve_tabela(planilha, df, linha=0, cabecalho=True):
+    if cabecalho:
+        planilha.write_row(linha, 0, [str(c) for c in df.columns])
+        linha += 1
+    colunas = [_valores_celulas(df[c]) for c in df.columns]
+    for valores in zip(*colunas):
+        if planilha.write_row(linha, 0, valores) == -1:
+            limite = f"{LIMITE_LINHAS_XLSX:,}".replace(",", ".")
+            raise ValueError(f"Uma planilha XLSX comporta no máximo {limite} lançamentos; "
+                             "exporte em CSV ou Parquet.")
+        linha += 1
+    return linha
+
+
+# Razão filtrado + planilhas de Resumo e Indicadores. No modo de memória
+# constante o xlsxwriter descarrega cada linha assim que a próxima começa.
+def razao_xlsx(blocos, cubo, indicadores):
+    def escreve(caminho):
+        pasta = xlsxwriter.Workbook(caminho, {
+            'constant_memory': True,
+            'default_date_format': 'dd/mm/yyyy',
+            'tmpdir': os.path.dirname(caminho),
+        })
+        planilha = pasta.add_worksheet('Razão')
+        linha = 0
+        for i, bloco in enumerate(_com_rotulos(blocos)):
+            linha = _escreve_tabela(planilha, bloco, linha, cabecalho=(i == 0))
+        _escreve_tabela(pasta.add_worksheet('Resumo'), resumo_por_conta(cubo).reset_index())
+        _escreve_tabela(pasta.add_worksheet('Indicadores'), indicadores.reset_index())
+        pasta.close()
+    return _em_arquivo_temporario(".xlsx", escreve)
+
+
+def exporta_razao(formato, blocos, cubo, indicadores):
+    with etapa(f"exportacao_{formato.lower()}", entrada=int(cubo.quantidade.sum())) as medicao:
+        if formato == "XLSX":
+            dados = razao_xlsx(blocos, cubo, indicadores)
+        elif formato == "CSV":
+            dados = razao_csv(blocos)
+        else:
+            dados = razao_parquet(blocos)
+        medicao.saida(len(dados))
+    return dados
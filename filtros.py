@@ -0,0 +1,343 @@
+import numpy as np
+import pandas as pd
+
+from agregacao import monta_cubo, recorta_cubo, soma_cubos
+from busca_contas import IndiceBuscaContas
+from cache_planilhas import tamanho_df
+from paginacao import ordem_da_pagina
+from razao import SEM_MES, junta_razoes, meses_presentes, une_categorias
+
+# ------------------------------------------------------------------------------
+# Índices de filtro do razão.
+# Montados uma vez por planilha carregada (ParteRazao): para cada conta, mês e
+# grupo guardam as posições das linhas correspondentes (agrupamento por
+# ordenação, no formato "ordem + limites"). O índice de um conjunto de planilhas
+# (IndiceRazao) junta as partes pelo deslocamento das linhas de cada uma, sem
+# concatenar nem reordenar o histórico: incluir um mês custa só a parte dele.
+# Os filtros da barra lateral viram seleções por código, que são aplicadas
+# direto no cubo mês x conta sempre que possível; as linhas só são
+# materializadas (uma única vez) quando alguma aba precisa delas.
+# ------------------------------------------------------------------------------
+class _Indice:
+    def __init__(self, codigos, n_baldes):
+        baldes = codigos.astype("int64")
+        self.ordem = np.argsort(baldes, kind="stable").astype(_tipo_posicao(len(codigos)))
+        self.limites = np.concatenate([[0], np.cumsum(np.bincount(baldes, minlength=n_baldes))])
+
+    def tamanhos(self):
+        return np.diff(self.limites)
+
+    def posicoes(self, baldes):
+        return np.concatenate(
+            [self.ordem[self.limites[b]:self.limites[b + 1]] for b in baldes]
+            or [np.array([], dtype=self.ordem.dtype)]
+        )
+
+
+def _tipo_posicao(n):
+    return "int32" if n < np.iinfo("int32").max else "int64"
+
+
+# Operações que dependem só do cubo mês x conta e do grupo de cada conta. As
+# subclasses definem `cubo`, `contas`, `busca_contas`, `meses`, `grupos` e
+# `grupo_da_conta`, e as consultas sobre as linhas: em memória (IndiceRazao) ou
+# num banco de dados local (banco.ConsultaRazao).
+class FiltrosRazao:
+    # Nas funções abaixo `contas_ok` é uma máscara sobre as contas (categorias) e
+    # `meses` a lista de códigos de mês selecionados (None = todos).
+    def _meses_cubo(self, meses):
+        if meses is None:
+            return np.ones(len(self.cubo.meses), dtype=bool)
+        return np.isin(self.cubo.meses, meses)
+
+    def meses_com_lancamentos(self, contas_ok):
+        if contas_ok.all():
+            return self.meses
+        return self.cubo.meses[self.cubo.quantidade[:, contas_ok].sum(axis=1) > 0]
+
+    def grupos_presentes(self, contas_ok, meses):
+        if self.grupo_da_conta is not None:
+            presentes = self.cubo.quantidade[self._meses_cubo(meses)][:, contas_ok].sum(axis=0) > 0
+            codigos = np.unique(self.grupo_da_conta[np.flatnonzero(contas_ok)[presentes]])
+            return self.grupos[codigos[codigos >= 0]]
+        return self._grupos_nas_linhas(contas_ok, meses)
+
+    # Quando cada conta pertence a um único grupo, filtrar por grupo é o mesmo
+    # que filtrar pelas contas do grupo, e o filtro pode ir direto ao cubo.
+    def contas_do_grupo(self, grupo):
+        if self.grupo_da_conta is None:
+            return None
+        return self.grupo_da_conta == self.grupos.get_loc(grupo)
+
+    # Lançamentos sem data válida (vazia ou não reconhecida na leitura)
+    def n_linhas_sem_data(self):
+        if SEM_MES not in self.meses:
+            return 0
+        return self.n_linhas_filtradas(np.ones(len(self.contas), dtype=bool), [SEM_MES])
+
+    def cubo_filtrado(self, contas_ok, meses, grupo=None):
+        if grupo is None:
+            return recorta_cubo(self.cubo, self._meses_cubo(meses), contas_ok)
+        return self._cubo_nas_linhas(contas_ok, meses, grupo)
+
+
+# Índices e cubo de uma planilha, com os códigos de conta, mês e grupo dela
+class ParteRazao:
+    def __init__(self, df, chave=None):
+        self.df = df
+        self.chave = chave
+        self.n_linhas = len(df)
+        self.cubo = monta_cubo(df)
+        self.contas = self.cubo.contas
+        self.meses = meses_presentes(df)
+
+        self.codigos_conta = df["ContaContabil"].cat.codes.to_numpy()
+        self.codigos_mes = np.searchsorted(self.meses, df["MesCodigo"].to_numpy())
+        # Categorias usam o balde 0 para "sem valor" (código -1)
+        self.por_conta = _Indice(self.codigos_conta + 1, len(self.contas) + 1)
+        self.por_mes = _Indice(self.codigos_mes, len(self.meses))
+
+        self.grupos = None
+        if "GrupoDeConta" in df.columns:
+            self.grupos = df["GrupoDeConta"].cat.categories
+            self.codigos_grupo = df["GrupoDeConta"].cat.codes.to_numpy()
+            self.por_grupo = _Indice(self.codigos_grupo + 1, len(self.grupos) + 1)
+            self.pares_conta_grupo = _pares_conta_grupo(self.codigos_conta, self.codigos_grupo)
+
+    # Bytes ocupados pelo razão e pelos índices
+    def tamanho(self):
+        indices = [self.por_conta, self.por_mes] + ([self.por_grupo] if self.grupos is not None else [])
+        arrays = [self.codigos_conta, self.codigos_mes] + [a for i in indices for a in (i.ordem, i.limites)]
+        return tamanho_df(self.df) + sum(a.nbytes for a in arrays)
+
+    # Posições (em ordem crescente) das linhas que atendem a todos os filtros:
+    # `contas_ok` e `meses_ok` são máscaras sobre as contas e os meses desta
+    # parte e `grupo` o nome do grupo (None = sem aquele filtro). Parte do índice
+    # mais seletivo, de forma que o custo é proporcional às linhas selecionadas.
+    def posicoes(self, contas_ok, meses_ok, grupo):
+        candidatos = []
+        if contas_ok is not None:
+            # Balde 0 = linhas sem conta, que ficam de fora quando há filtro
+            candidatos.append((self.por_conta, np.flatnonzero(contas_ok) + 1))
+        if meses_ok is not None:
+            candidatos.append((self.por_mes, np.flatnonzero(meses_ok)))
+        if grupo is not None:
+            if self.grupos is None or grupo not in self.grupos:
+                return np.array([], dtype=self.por_conta.ordem.dtype)
+            codigo_grupo = self.grupos.get_loc(grupo)
+            candidatos.append((self.por_grupo, [codigo_grupo + 1]))
+        if not candidatos:
+            return np.arange(self.n_linhas, dtype=self.por_conta.ordem.dtype)
+
+        indice, baldes = min(candidatos, key=lambda c: c[0].tamanhos()[c[1]].sum())
+        posicoes = indice.posicoes(baldes)
+        if contas_ok is not None and indice is not self.por_conta:
+            conta_ok_linha = np.concatenate([[False], contas_ok])
+            posicoes = posicoes[conta_ok_linha[self.codigos_conta[posicoes] + 1]]
+        if meses_ok is not None and indice is not self.por_mes:
+            posicoes = posicoes[meses_ok[self.codigos_mes[posicoes]]]
+        if grupo is not None and indice is not self.por_grupo:
+            posicoes = posicoes[self.codigos_grupo[posicoes] == codigo_grupo]
+        posicoes.sort()
+        return posicoes
+
+
+# Índice de um conjunto de planilhas. As linhas do conjunto são as das partes,
+# uma após a outra; as partes não são copiadas nem alteradas e podem ser
+# reaproveitadas por outro conjunto (um conjunto com um mês a mais usa as
+# mesmas partes e monta só a do mês novo).
+class IndiceRazao(FiltrosRazao):
+    # `partes`: ParteRazao de cada planilha (um DataFrame vira uma parte só)
+    def __init__(self, partes):
+        if isinstance(partes, pd.DataFrame):
+            partes = [ParteRazao(partes)]
+        self.partes = list(partes)
+        self.inicios = np.concatenate([[0], np.cumsum([parte.n_linhas for parte in self.partes])]).astype("int64")
+        self.n_linhas = int(self.inicios[-1])
+        self.cubo = soma_cubos([parte.cubo for parte in self.partes])
+        self.contas = self.cubo.contas
+        self.busca_contas = IndiceBuscaContas(self.contas)
+        self.meses = np.unique(np.concatenate([parte.meses for parte in self.partes]))
+
+        # Código, no conjunto, de cada conta, mês e grupo de cada parte
+        self._conta_na_parte = [self.contas.get_indexer(parte.contas) for parte in self.partes]
+        self._mes_na_parte = [np.searchsorted(self.meses, parte.meses) for parte in self.partes]
+        self.grupos = None
+        self.grupo_da_conta = None
+        com_grupo = [parte.grupos for parte in self.partes if parte.grupos is not None]
+        if com_grupo:
+            self.grupos = pd.Index(une_categorias(*com_grupo))
+            self._grupo_na_parte = [None if parte.grupos is None else self.grupos.get_indexer(parte.grupos)
+                                    for parte in self.partes]
+            self.grupo_da_conta = self._grupo_unico_por_conta()
+        self._ultimo_filtro = None
+
+    # Pares (conta, grupo) de todas as partes, com os códigos do conjunto. Linhas
+    # de planilhas sem a coluna de grupo não têm grupo.
+    def _grupo_unico_por_conta(self):
+        contas, grupos = [], []
+        for parte, conta_na_parte, grupo_na_parte in zip(self.partes, self._conta_na_parte, self._grupo_na_parte):
+            if parte.grupos is None:
+                conta = np.flatnonzero(parte.cubo.quantidade.sum(axis=0) > 0)
+                grupo = np.full(len(conta), -1)
+            else:
+                conta, grupo = parte.pares_conta_grupo
+                grupo = np.where(grupo >= 0, grupo_na_parte[np.maximum(grupo, 0)], -1)
+            contas.append(conta_na_parte[conta])
+            grupos.append(grupo)
+        return _grupo_unico_por_conta(np.concatenate(contas), np.concatenate(grupos),
+                                      len(self.contas), len(self.grupos))
+
+    # Bytes ocupados pelo razão e pelos índices (uma parte usada por dois
+    # conjuntos conta nos dois)
+    def tamanho(self):
+        return sum(parte.tamanho() for parte in self.partes)
+
+    def _categorias(self):
+        categorias = {"ContaContabil": self.contas}
+        if self.grupos is not None:
+            categorias["GrupoDeConta"] = self.grupos
+        return categorias
+
+    # (parte, posições locais) de cada parte para as posições `posicoes` (em
+    # ordem crescente) do conjunto; None = todas as linhas da parte
+    def _por_parte(self, posicoes):
+        if posicoes is None:
+            return [(parte, None) for parte in self.partes]
+        cortes = np.searchsorted(posicoes, self.inicios)
+        return [(parte, posicoes[cortes[i]:cortes[i + 1]] - self.inicios[i]) for i, parte in enumerate(self.partes)]
+
+    # Linhas do conjunto nas posições `posicoes`, na ordem dada (None = todas)
+    def _linhas(self, posicoes):
+        if len(self.partes) == 1:
+            df = self.partes[0].df
+            return df if posicoes is None else df.take(posicoes)
+        if posicoes is None:
+            return junta_razoes([parte.df for parte in self.partes], self._categorias())
+        parte_da_linha = np.searchsorted(self.inicios, posicoes, side="right") - 1
+        ordem = np.argsort(parte_da_linha, kind="stable")
+        ordenadas = posicoes[ordem]
+        cortes = np.searchsorted(parte_da_linha[ordem], np.arange(len(self.partes) + 1))
+        dfs = [parte.df.take(ordenadas[cortes[i]:cortes[i + 1]] - self.inicios[i])
+               for i, parte in enumerate(self.partes) if cortes[i + 1] > cortes[i]]
+        df = junta_razoes(dfs or [self.partes[0].df.iloc[:0]], self._categorias())
+        if len(ordem) and (np.diff(ordem) < 0).any():
+            df = df.take(np.argsort(ordem)).reset_index(drop=True)
+        return df
+
+    # Coluna `coluna` das linhas nas posições `posicoes` (em ordem crescente),
+    # com os códigos de conta e grupo do conjunto
+    def _coluna(self, coluna, posicoes):
+        if len(self.partes) == 1:
+            serie = self.partes[0].df[coluna]
+            return serie if posicoes is None else serie.take(posicoes)
+        categorias = self._categorias().get(coluna)
+        mapas = {"ContaContabil": self._conta_na_parte,
+                 "GrupoDeConta": getattr(self, "_grupo_na_parte", None)}.get(coluna)
+        pedacos = []
+        for i, (parte, locais) in enumerate(self._por_parte(posicoes)):
+            n = parte.n_linhas if locais is None else len(locais)
+            if coluna not in parte.df.columns:
+                pedacos.append(np.full(n, -1))
+                continue
+            serie = parte.df[coluna] if locais is None else parte.df[coluna].take(locais)
+            if categorias is None:
+                pedacos.append(serie.to_numpy())
+            else:
+                codigos = serie.cat.codes.to_numpy()
+                pedacos.append(np.where(codigos >= 0, mapas[i][np.maximum(codigos, 0)], -1))
+        if categorias is None:
+            return pd.Series(np.concatenate(pedacos))
+        return pd.Series(pd.Categorical.from_codes(np.concatenate(pedacos), categories=categorias))
+
+    def _grupos_nas_linhas(self, contas_ok, meses):
+        codigos = []
+        for (parte, locais), grupo_na_parte in zip(self._por_parte(self.posicoes(contas_ok, meses)),
+                                                   self._grupo_na_parte):
+            if parte.grupos is None:
+                continue
+            presentes = np.unique(parte.codigos_grupo if locais is None else parte.codigos_grupo[locais])
+            codigos.append(grupo_na_parte[presentes[presentes >= 0]])
+        return self.grupos[np.unique(np.concatenate(codigos or [np.array([], dtype="int64")]))]
+
+    def _cubo_nas_linhas(self, contas_ok, meses, grupo):
+        return monta_cubo(self.linhas(contas_ok, meses, grupo))
+
+    def linhas(self, contas_ok, meses, grupo=None):
+        return self._linhas(self.posicoes(contas_ok, meses, grupo))
+
+    def n_linhas_sem_data(self):
+        return sum(int(parte.por_mes.tamanhos()[np.searchsorted(parte.meses, SEM_MES)])
+                   for parte in self.partes if SEM_MES in parte.meses)
+
+    def n_linhas_filtradas(self, contas_ok, meses, grupo=None):
+        posicoes = self._posicoes_memorizadas(contas_ok, meses, grupo)
+        return self.n_linhas if posicoes is None else len(posicoes)
+
+    # Página `pagina` das linhas filtradas, ordenadas por `coluna`
+    def pagina(self, contas_ok, meses, grupo, coluna, ascendente, pagina, tamanho):
+        posicoes = self._posicoes_memorizadas(contas_ok, meses, grupo)
+        ordem = ordem_da_pagina(self._coluna(coluna, posicoes), ascendente, pagina, tamanho)
+        return self._linhas(ordem if posicoes is None else posicoes[ordem])
+
+    # Linhas filtradas em blocos de até `tamanho`, na ordem original. Sempre há
+    # ao menos um bloco (vazio, se nenhuma linha passa nos filtros).
+    def blocos(self, contas_ok, meses, grupo=None, tamanho=50_000):
+        posicoes = self.posicoes(contas_ok, meses, grupo)
+        n_linhas = self.n_linhas if posicoes is None else len(posicoes)
+        for inicio in range(0, max(n_linhas, 1), tamanho):
+            fim = min(inicio + tamanho, n_linhas)
+            if posicoes is None and len(self.partes) == 1:
+                yield self.partes[0].df.iloc[inicio:fim]
+            else:
+                yield self._linhas(np.arange(inicio, fim) if posicoes is None else posicoes[inicio:fim])
+
+    # A aba Dados pede a contagem e a página com os mesmos filtros em seguida
+    def _posicoes_memorizadas(self, contas_ok, meses, grupo):
+        # O índice pode estar sendo usado por várias sessões ao mesmo tempo (ver
+        # cache_planilhas.CacheCompartilhado): filtro e posições mudam juntos
+        filtro = (contas_ok.tobytes(), None if meses is None else tuple(meses), grupo)
+        ultimo = self._ultimo_filtro
+        if ultimo is None or ultimo[0] != filtro:
+            ultimo = (filtro, self.posicoes(contas_ok, meses, grupo))
+            self._ultimo_filtro = ultimo
+        return ultimo[1]
+
+    # Posições (em ordem crescente) das linhas que atendem a todos os filtros, ou
+    # None quando nenhum filtro restringe nada. Cada parte responde com as suas
+    # posições, deslocadas pelo início dela no conjunto.
+    def posicoes(self, contas_ok, meses, grupo=None):
+        filtra_contas = not contas_ok.all()
+        meses_ok = np.ones(len(self.meses), dtype=bool) if meses is None else np.isin(self.meses, meses)
+        filtra_meses = not meses_ok.all()
+        if not filtra_contas and not filtra_meses and grupo is None:
+            return None
+
+        tipo = _tipo_posicao(self.n_linhas)
+        pedacos = []
+        for parte, inicio, conta_na_parte, mes_na_parte in zip(self.partes, self.inicios, self._conta_na_parte,
+                                                               self._mes_na_parte):
+            locais = parte.posicoes(contas_ok[conta_na_parte] if filtra_contas else None,
+                                    meses_ok[mes_na_parte] if filtra_meses else None, grupo)
+            pedacos.append(locais.astype("int64") + inicio)
+        return np.concatenate(pedacos).astype(tipo)
+
+
+# Pares distintos (conta, grupo) das linhas com conta
+def _pares_conta_grupo(codigos_conta, codigos_grupo):
+    validos = codigos_conta >= 0
+    n_grupos = int(codigos_grupo.max()) + 2 if len(codigos_grupo) else 1
+    pares = np.unique(codigos_conta[validos].astype("int64") * n_grupos + codigos_grupo[validos] + 1)
+    return pares // n_grupos, pares % n_grupos - 1
+
+
+# Grupo de cada conta (código), ou None se alguma conta aparece em mais de um grupo
+def _grupo_unico_por_conta(codigos_conta, codigos_grupo, n_contas, n_grupos):
+    validos = codigos_conta >= 0
+    pares = np.unique(codigos_conta[validos].astype("int64") * (n_grupos + 1) + codigos_grupo[validos] + 1)
+    contas_pares = pares // (n_grupos + 1)
+    if len(np.unique(contas_pares)) != len(contas_pares):
+        return None
+    grupo_da_conta = np.full(n_contas, -1, dtype="int64")
+    grupo_da_conta[contas_pares] = pares % (n_grupos + 1) - 1
+    return grupo_da_conta
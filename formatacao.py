@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Formatação de valores em Reais (padrão brasileiro: milhar com ponto e decimal
+# com vírgula), vetorizada: uma Series/array inteira é formatada de uma vez com
+# operações de string do NumPy, sem chamar Python para cada célula.
+# ------------------------------------------------------------------------------
+
+# Acima disso os centavos não cabem com folga em int64; esses (raros) valores,
+# assim como inf, vão pelo caminho escalar
+LIMITE_VETORIZADO = 1e15
+
+
+def _formata_escalar(valor):
+    return f"R$ {valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _formata_array(valores):
+    valores = np.asarray(valores, dtype="float64")
+    forma = valores.shape
+    valores = valores.ravel()
+    resultado = np.full(valores.shape, "", dtype=object)
+    ausentes = np.isnan(valores)
+    vetorizados = ~ausentes & (np.abs(valores) < LIMITE_VETORIZADO)
+
+    absolutos = np.abs(valores[vetorizados]) * 100
+    centavos = np.rint(absolutos)
+    # Casos muito próximos de meio centavo dependem da representação binária
+    # exata do número; para esses, o arredondamento fica com o f-string.
+    tolerancia = np.maximum(1e-6, np.spacing(absolutos) * 4)
+    ambiguos = np.abs(absolutos - np.trunc(absolutos) - 0.5) < tolerancia
+    escalares = ~ausentes & ~vetorizados
+    escalares[np.flatnonzero(vetorizados)[ambiguos]] = True
+    vetorizados[np.flatnonzero(vetorizados)[ambiguos]] = False
+    centavos = centavos[~ambiguos].astype("int64")
+    negativos = np.signbit(valores[vetorizados])
+
+    resultado[vetorizados] = _monta_textos(centavos, negativos)
+    for posicao in np.flatnonzero(escalares):
+        resultado[posicao] = _formata_escalar(valores[posicao])
+    return resultado.reshape(forma)
+
+
+# Monta os textos "R$ -1.234,56" byte a byte numa matriz (uma linha por valor).
+# As linhas são agrupadas por sinal e quantidade de dígitos; dentro de cada
+# grupo todo dígito tem coluna fixa e é escrito de uma vez para o bloco inteiro.
+def _monta_textos(centavos, negativos):
+    n = len(centavos)
+    if n == 0:
+        return np.array([], dtype=object)
+    inteiros = centavos // 100
+    n_digitos = np.ones(n, dtype="int64")
+    potencia = 10
+    while potencia <= inteiros.max():
+        n_digitos += inteiros >= potencia
+        potencia *= 10
+
+    grupo = n_digitos * 2 + negativos
+    ordem = np.argsort(grupo, kind="stable")
+    grupos, inicios = np.unique(grupo[ordem], return_index=True)
+    inteiros = inteiros[ordem]
+    centavos = centavos[ordem]
+
+    largura = 4 + int(n_digitos.max()) * 4 // 3 + 3
+    matriz = np.zeros((n, largura), dtype="uint8")
+    matriz[:, :3] = np.frombuffer(b"R$ ", dtype="uint8")
+    for g, inicio, fim in zip(grupos, inicios, list(inicios[1:]) + [n]):
+        digitos, negativo = divmod(int(g), 2)
+        bloco = matriz[inicio:fim]
+        restante = inteiros[inicio:fim].copy()
+        if negativo:
+            bloco[:, 3] = ord("-")
+        fim_inteiro = 3 + negativo + digitos + (digitos - 1) // 3
+        for k in range(digitos):
+            coluna = fim_inteiro - 1 - k - k // 3
+            bloco[:, coluna] = ord("0") + restante % 10
+            if k > 0 and k % 3 == 0:
+                bloco[:, coluna + 1] = ord(".")
+            restante //= 10
+        bloco[:, fim_inteiro] = ord(",")
+        bloco[:, fim_inteiro + 1] = ord("0") + centavos[inicio:fim] // 10 % 10
+        bloco[:, fim_inteiro + 2] = ord("0") + centavos[inicio:fim] % 10
+
+    # Bytes nulos à direita são descartados pelo tipo "S"
+    textos = np.empty(n, dtype=object)
+    textos[ordem] = matriz.view(f"S{largura}").ravel().astype("U").astype(object)
+    return textos
+
+
+# Aceita um número, uma Series ou um array. Valores ausentes viram "".
+def formata_valor_brasil(valor):
+    if isinstance(valor, pd.Series):
+        return pd.Series(_formata_array(valor.to_numpy(dtype="float64", na_value=np.nan)),
+                         index=valor.index, name=valor.name, dtype=object)
+    if isinstance(valor, (np.ndarray, list, tuple, pd.Index)):
+        return _formata_array(valor)
+    if pd.isnull(valor):
+        return ""
+    return _formata_escalar(valor)
+
+
+# Cópia do DataFrame com todas as colunas numéricas formatadas em Reais
+def formata_tabela_brasil(df, colunas=None):
+    formatado = df.copy()
+    for coluna in colunas if colunas is not None else df.columns:
+        if pd.api.types.is_numeric_dtype(df[coluna]):
+            formatado[coluna] = formata_valor_brasil(df[coluna])
+    return formatado
@@ -0,0 +1,171 @@
+import hashlib
+import json
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+import configuracao
+from cache_planilhas import CacheMemoria
+
+# ------------------------------------------------------------------------------
+# Construção dos gráficos do dashboard.
+# Cada gráfico é montado por uma função chamada apenas quando a seção que o
+# exibe está aberta; nenhuma figura é construída de antemão.
+# O dashboard pede as figuras por `figura(funcao, df, ...)`: a especificação
+# (JSON do Plotly) fica em cache pelo hash dos dados agregados, dos parâmetros
+# e do tema, e uma nova execução com os mesmos dados só a remonta a partir do
+# JSON, sem passar de novo pelo plotly.express.
+# ------------------------------------------------------------------------------
+TEMA = 'plotly_white'
+
+# Contas exibidas individualmente nos gráficos por conta; as demais somam em "Outros"
+N_CONTAS_ENTRADAS = 15
+N_CONTAS_SAIDAS = 5
+OUTROS = 'Outros'
+
+# Séries com mais pontos que isso (vários anos de meses) usam traços WebGL
+LIMITE_PONTOS_SVG = 36
+
+cache_figuras = CacheMemoria(configuracao.CACHE_FIGURAS_MB * 1024 * 1024, tamanho=len)
+
+
+def chave_figura(nome, df, parametros, tema):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([nome, list(map(str, df.columns)), parametros, tema], default=str).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# Figura de `funcao(df, *parametros)`, montada só na primeira vez para cada
+# combinação de dados, parâmetros e tema. O tema padrão do Plotly entra na
+# chave porque as figuras sem `template` próprio o embutem no JSON.
+def figura(funcao, df, *parametros):
+    chave = chave_figura(funcao.__name__, df, parametros, [TEMA, pio.templates.default])
+    spec = cache_figuras.get(chave)
+    if spec is None:
+        spec = funcao(df, *parametros).to_json()
+        cache_figuras.put(chave, spec)
+    # O JSON já foi validado quando a figura foi montada
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+# As `n` contas de maior valor e a soma das demais numa barra "Outros"
+def maiores_e_outros(df_agrupado, n):
+    maiores = df_agrupado.nlargest(n, 'Valor')
+    resto = df_agrupado['Valor'].sum() - maiores['Valor'].sum()
+    if len(df_agrupado) > n and resto > 0:
+        maiores = pd.concat([maiores, pd.DataFrame({'ContaContabil': [OUTROS], 'Valor': [resto]})],
+                            ignore_index=True)
+    return maiores
+
+
+# Mini-gráfico (sparkline) da evolução da margem de contribuição ajustada, em Reais
+def grafico_sparkline(df_contrib):
+    fig_spark = px.line(
+        df_contrib,
+        x="Mês/Ano",
+        y="Contribuição Ajustada",
+        markers=True,
+        title="",
+        render_mode="webgl" if len(df_contrib) > LIMITE_PONTOS_SVG else "svg"
+    )
+    fig_spark.update_layout(
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        xaxis_title="",
+        yaxis_title="",
+        font=dict(color="#FFFFFF"),
+        height=150
+    )
+    fig_spark.update_traces(line_color="#FFFFFF")
+    fig_spark.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
+    return fig_spark
+
+
+# Evolução da Contribuição Ajustada: uma linha tracejada por conta da fórmula e
+# a linha cheia do indicador
+def grafico_evolucao(df_pivot, contas, titulo):
+    fig_evol = go.Figure()
+    x_vals = df_pivot["Mês/Ano"]
+    Scatter = go.Scattergl if len(df_pivot) > LIMITE_PONTOS_SVG else go.Scatter
+    for conta in contas:
+        if conta in df_pivot.columns:
+            fig_evol.add_trace(
+                Scatter(
+                    x=x_vals,
+                    y=df_pivot[conta],
+                    mode="lines+markers",
+                    name=conta,
+                    line=dict(dash="dash")
+                )
+            )
+    fig_evol.add_trace(
+        Scatter(
+            x=x_vals,
+            y=df_pivot[titulo],
+            mode="lines+markers",
+            name=titulo,
+            line=dict(dash="solid", width=3)
+        )
+    )
+    fig_evol.update_layout(
+        title="Evolução da Contribuição Ajustada (por Mês/Ano)",
+        yaxis_tickprefix="R$ ",
+        yaxis_tickformat=",.2f"
+    )
+    return fig_evol
+
+
+# Uma única série de barras com as maiores contas e "Outros" (e não uma série por
+# conta, que com centenas de contas deixava a figura enorme)
+def grafico_entradas(df_positivo_agrupado, n=N_CONTAS_ENTRADAS):
+    maiores = maiores_e_outros(df_positivo_agrupado, n)
+    fig_entradas = px.bar(
+        maiores,
+        x='ContaContabil',
+        y='Valor',
+        title='Entradas por Conta Contábil',
+        labels={'Valor': 'Valor (R$)', 'ContaContabil': 'Conta Contábil'},
+        template=TEMA
+    )
+    fig_entradas.update_layout(xaxis_tickangle=-45)
+    fig_entradas.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
+    return fig_entradas
+
+
+def grafico_top_saidas(df_negativo_agrupado, n=N_CONTAS_SAIDAS):
+    top_saidas = maiores_e_outros(df_negativo_agrupado, n)
+    fig_saidas = px.bar(
+        top_saidas,
+        y='ContaContabil',
+        x='Valor',
+        orientation='h',
+        title=f'Top {n} Categorias de Saídas',
+        labels={'Valor': 'Valor (R$)', 'ContaContabil': 'Conta Contábil'},
+        template=TEMA
+    )
+    # Maior conta no topo e "Outros" por último
+    fig_saidas.update_layout(yaxis={'categoryorder': 'array',
+                                    'categoryarray': top_saidas['ContaContabil'].tolist()[::-1]})
+    fig_saidas.update_xaxes(tickprefix="R$ ", tickformat=",.2f")
+    return fig_saidas
+
+
+# Barras agrupadas por Mês/Ano com uma cor por "Tipo" (entradas x saídas e as
+# comparações entre indicadores)
+def grafico_por_tipo(df_melt, titulo):
+    fig = px.bar(
+        df_melt,
+        x='Mês/Ano',
+        y='Valor',
+        color='Tipo',
+        barmode='group',
+        title=titulo,
+        labels={'Valor': 'Valor (R$)'},
+        template=TEMA
+    )
+    fig.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
+    return fig
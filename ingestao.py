@@ -0,0 +1,261 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from razao import normaliza_razao, une_categorias
+
+# ------------------------------------------------------------------------------
+# Leitura do razão contábil a partir do Excel.
+# Lê apenas as colunas usadas pelo dashboard, já com os tipos finais, em blocos
+# de linhas (streaming) para manter o pico de memória baixo em planilhas grandes.
+# ------------------------------------------------------------------------------
+COLUNAS_OBRIGATORIAS = ["Data", "ContaContabil", "Valor"]
+COLUNAS_OPCIONAIS = ["GrupoDeConta"]
+
+# Incrementar quando o formato do DataFrame produzido mudar (invalida caches)
+VERSAO = "3"
+
+TAMANHO_BLOCO = 50_000
+
+try:
+    import python_calamine  # noqa: F401
+    CALAMINE_DISPONIVEL = True
+except ImportError:
+    CALAMINE_DISPONIVEL = False
+
+
+class PlanilhaInvalida(ValueError):
+    pass
+
+
+def valida_cabecalho(cabecalho):
+    nomes = [str(c).strip() if c is not None else "" for c in cabecalho]
+    faltando = [c for c in COLUNAS_OBRIGATORIAS if c not in nomes]
+    if faltando:
+        raise PlanilhaInvalida(
+            "Coluna(s) obrigatória(s) ausente(s) na planilha: " + ", ".join(faltando)
+        )
+    return {c: nomes.index(c) for c in COLUNAS_OBRIGATORIAS + COLUNAS_OPCIONAIS if c in nomes}
+
+
+def _vazio(valor):
+    return valor is None or (isinstance(valor, float) and valor != valor)
+
+
+# Converte um bloco de linhas lidas para os tipos finais. As colunas de texto
+# viram (códigos, valores distintos do bloco): os textos de cada linha não
+# sobrevivem ao bloco, só os distintos.
+def _converte_bloco(bloco):
+    convertido = {}
+    for nome, valores in bloco.items():
+        if nome == "Valor":
+            convertido[nome] = pd.to_numeric(pd.Series(valores, dtype=object), errors="coerce").to_numpy(dtype="float64")
+        elif nome == "Data":
+            convertido[nome] = converte_datas(pd.Series(valores, dtype=object)).to_numpy()
+        else:
+            codigos, unicos = pd.factorize(np.array([None if _vazio(v) else str(v) for v in valores], dtype=object))
+            convertido[nome] = (codigos.astype("int32"), np.asarray(unicos, dtype=object))
+    return convertido
+
+
+# Junta os (códigos, distintos) de cada bloco numa coluna categórica, com as
+# categorias na ordem de une_categorias
+def _categorica(partes):
+    categorias = pd.Index(une_categorias(*(unicos for _, unicos in partes)), dtype=object)
+    codigos = np.empty(sum(len(c) for c, _ in partes), dtype="int32")
+    inicio = 0
+    for codigos_bloco, unicos in partes:
+        mapa = np.append(categorias.get_indexer(unicos), -1).astype("int32")
+        codigos[inicio:inicio + len(codigos_bloco)] = mapa[codigos_bloco]
+        inicio += len(codigos_bloco)
+    return pd.Categorical.from_codes(codigos, categories=categorias)
+
+
+# ------------------------------------------------------------------------------
+# Datas.
+# Convertidas uma única vez, na leitura. A coluna costuma ter poucas datas
+# distintas repetidas em muitas linhas, então só os valores distintos são
+# convertidos: datas do Excel diretamente; números como datas seriais do Excel
+# (dias desde 30/12/1899); textos pelo formato detectado numa amostra (com
+# formato explícito, sem adivinhação elemento a elemento), depois pelos demais
+# formatos conhecidos (colunas com formatos misturados) e, por fim, por
+# interpretação livre com o dia primeiro. O que sobra fica NaT, e essas linhas
+# aparecem em Mês/Ano como "NaT" (ver FiltrosRazao.n_linhas_sem_data).
+# ------------------------------------------------------------------------------
+FORMATOS_DATA = (
+    "%d/%m/%Y", "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%y",
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+    "%d-%m-%Y", "%d.%m.%Y", "%Y/%m/%d",
+)
+AMOSTRA_DATAS = 500
+
+ORIGEM_EXCEL = pd.Timestamp("1899-12-30")
+SERIAL_MAXIMO = 2_958_465  # 31/12/9999
+
+
+def converte_datas(serie):
+    codigos, unicos = pd.factorize(np.asarray(serie, dtype=object))
+    datas = _converte_valores(np.asarray(unicos, dtype=object))
+    return pd.Series(np.where(codigos >= 0, datas[codigos], np.datetime64("NaT", "us")), index=serie.index)
+
+
+def _converte_valores(valores):
+    datas = np.full(len(valores), np.datetime64("NaT", "us"))
+    textos = np.fromiter((isinstance(v, str) for v in valores), dtype=bool, count=len(valores))
+    numeros = np.fromiter((isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in valores),
+                          dtype=bool, count=len(valores))
+    objetos = np.fromiter((isinstance(v, (datetime.date, np.datetime64)) for v in valores),
+                          dtype=bool, count=len(valores))
+    if objetos.any():
+        datas[objetos] = _em_microssegundos(pd.to_datetime(list(valores[objetos]), errors="coerce"))
+    if numeros.any():
+        datas[numeros] = seriais_excel(valores[numeros].astype("float64"))
+    if textos.any():
+        datas[textos] = _converte_textos(valores[textos])
+    return datas
+
+
+def _em_microssegundos(datas):
+    return pd.DatetimeIndex(datas).tz_localize(None).as_unit("us").to_numpy()
+
+
+# Datas seriais do Excel (1 = 01/01/1900); fora do intervalo válido viram NaT
+def seriais_excel(numeros):
+    datas = np.full(len(numeros), np.datetime64("NaT", "us"))
+    validos = (numeros >= 1) & (numeros <= SERIAL_MAXIMO)
+    segundos = np.round(numeros[validos] * 86_400).astype("int64")
+    datas[validos] = ORIGEM_EXCEL.to_datetime64().astype("datetime64[us]") + segundos.astype("timedelta64[s]")
+    return datas
+
+
+# Formatos conhecidos que reconhecem algum texto da amostra, do que reconhece
+# mais para o que reconhece menos
+def detecta_formatos(amostra):
+    acertos = []
+    for formato in FORMATOS_DATA:
+        n = pd.to_datetime(amostra, format=formato, errors="coerce").notna().sum()
+        if n:
+            acertos.append((-n, FORMATOS_DATA.index(formato), formato))
+    return [formato for _, _, formato in sorted(acertos)]
+
+
+def _converte_textos(textos):
+    textos = np.array([t.strip() for t in textos], dtype=object)
+    datas = np.full(len(textos), np.datetime64("NaT", "us"))
+    pendentes = textos != ""
+    for formato in detecta_formatos(textos[pendentes][:AMOSTRA_DATAS]):
+        posicoes = np.flatnonzero(pendentes)
+        if not len(posicoes):
+            break
+        convertidas = pd.to_datetime(textos[posicoes], format=formato, errors="coerce")
+        ok = convertidas.notna()
+        datas[posicoes[ok]] = _em_microssegundos(convertidas[ok])
+        pendentes[posicoes[ok]] = False
+
+    # Datas seriais gravadas como texto ("45292")
+    posicoes = np.flatnonzero(pendentes)
+    if len(posicoes):
+        numeros = pd.to_numeric(textos[posicoes], errors="coerce").astype("float64")
+        convertidas = seriais_excel(numeros)
+        ok = ~np.isnat(convertidas)
+        datas[posicoes[ok]] = convertidas[ok]
+        pendentes[posicoes[ok]] = False
+
+    posicoes = np.flatnonzero(pendentes)
+    if len(posicoes):
+        convertidas = pd.to_datetime(textos[posicoes], dayfirst=True, errors="coerce", format="mixed")
+        datas[posicoes] = _em_microssegundos(convertidas)
+    return datas
+
+
+def _monta_df(colunas, blocos):
+    dados = {}
+    for nome in colunas:
+        partes = [b[nome] for b in blocos]
+        if nome == "Data":
+            dados[nome] = np.concatenate(partes) if partes else np.array([], dtype="datetime64[ns]")
+        elif nome == "Valor":
+            dados[nome] = np.concatenate(partes) if partes else np.array([], dtype="float64")
+        else:
+            dados[nome] = _categorica(partes)
+        # Libera os blocos dessa coluna antes de concatenar a próxima
+        for b in blocos:
+            del b[nome]
+    return pd.DataFrame(dados, columns=colunas, copy=False)
+
+
+# Lê as linhas da planilha (a primeira é o cabeçalho) em blocos de
+# TAMANHO_BLOCO, convertendo cada bloco assim que ele fica completo. Células
+# vazias chegam como None (openpyxl) ou "" (calamine); linhas inteiramente
+# vazias são ignoradas. `total` é a estimativa de linhas usada no progresso.
+def _le_linhas(linhas, total, progresso):
+    try:
+        cabecalho = next(linhas)
+    except StopIteration:
+        raise PlanilhaInvalida("A planilha está vazia.")
+    posicoes = valida_cabecalho(cabecalho)
+    colunas = list(posicoes)
+
+    blocos = []
+    bloco = {c: [] for c in colunas}
+    lidas = 0
+    for linha in linhas:
+        if linha is None or all(v is None or v == "" for v in linha):
+            continue
+        for nome, pos in posicoes.items():
+            valor = linha[pos] if pos < len(linha) else None
+            bloco[nome].append(None if valor == "" else valor)
+        lidas += 1
+        if lidas % TAMANHO_BLOCO == 0:
+            blocos.append(_converte_bloco(bloco))
+            bloco = {c: [] for c in colunas}
+            if progresso is not None:
+                progresso(lidas, max(total, lidas))
+    if bloco[colunas[0]]:
+        blocos.append(_converte_bloco(bloco))
+    if progresso is not None:
+        progresso(lidas, lidas)
+    return _monta_df(colunas, blocos)
+
+
+def _le_openpyxl(arquivo, progresso):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total = max((ws.max_row or 1) - 1, 0)
+        return _le_linhas(ws.iter_rows(values_only=True), total, progresso)
+    finally:
+        wb.close()
+
+
+# calamine carrega a planilha em memória nativa (compacta); as linhas viram
+# objetos Python uma a uma, no mesmo laço em blocos do openpyxl
+def _le_calamine(arquivo, progresso):
+    from python_calamine import CalamineWorkbook
+
+    wb = CalamineWorkbook.from_object(arquivo)
+    try:
+        planilha = wb.get_sheet_by_index(0)
+        total = max(planilha.height - 1, 0)
+        return _le_linhas(iter(planilha.iter_rows()), total, progresso)
+    finally:
+        wb.close()
+
+
+# Lê o razão de `arquivo` (caminho ou objeto binário) e retorna o DataFrame já
+# normalizado (ver razao.normaliza_razao).
+# `progresso(lidas, total)` é chamado a cada bloco de linhas lidas.
+# Qualquer falha da leitura (arquivo corrompido, que não é XLSX, ...) vira
+# PlanilhaInvalida, como um cabeçalho sem as colunas obrigatórias.
+def le_razao(arquivo, progresso=None):
+    leitor = _le_calamine if CALAMINE_DISPONIVEL else _le_openpyxl
+    try:
+        df = leitor(arquivo, progresso)
+    except (PlanilhaInvalida, MemoryError):
+        raise
+    except Exception as erro:
+        raise PlanilhaInvalida(f"Não foi possível ler o arquivo como planilha XLSX ({erro}).") from erro
+    return normaliza_razao(df)
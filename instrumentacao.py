@@ -0,0 +1,137 @@
+import functools
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import configuracao
+
+# ------------------------------------------------------------------------------
+# Instrumentação das etapas do dashboard.
+# Cada etapa (leitura, filtros, indicadores, abas, exportação) é envolvida em
+#   with etapa("nome", entrada=<linhas>) as medicao:
+#       ...
+#       medicao.saida(<linhas>)
+# que registra tempo de parede, linhas de entrada/saída e a variação de memória
+# (RSS) do processo. Os registros de cada execução do script ficam disponíveis
+# para o painel de desempenho e cada um é emitido como uma linha de log JSON
+# (logger "dashboard.desempenho").
+# Desligada (padrão; ver DASHBOARD_INSTRUMENTACAO), `etapa` devolve sempre o
+# mesmo objeto que não faz nada, e o custo é só o de uma chamada de função.
+# ------------------------------------------------------------------------------
+ATIVA = configuracao.INSTRUMENTACAO
+
+logger = logging.getLogger("dashboard.desempenho")
+if ATIVA and not logger.handlers:
+    _saida_log = logging.StreamHandler(sys.stderr)
+    _saida_log.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_saida_log)
+    logger.setLevel(logging.INFO)
+
+try:
+    import psutil
+    _processo = psutil.Process()
+except ImportError:
+    _processo = None
+
+_local = threading.local()
+_execucoes = itertools.count(1)
+
+
+# Memória residente do processo, em bytes (None se não for possível medir)
+def memoria_residente():
+    if _processo is not None:
+        return _processo.memory_info().rss
+    try:
+        with open("/proc/self/statm") as arquivo:
+            return int(arquivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class _Etapa:
+    def __init__(self, nome, entrada):
+        self.nome = nome
+        self.entrada = entrada
+        self._saida = None
+
+    def saida(self, linhas):
+        self._saida = linhas
+
+    def __enter__(self):
+        nivel = getattr(_local, "nivel", 0)
+        _local.nivel = nivel + 1
+        # O registro entra na lista já no início, para as etapas internas
+        # aparecerem depois da etapa que as contém
+        self._registro = {"execucao": getattr(_local, "execucao", None), "etapa": self.nome, "nivel": nivel}
+        registros = getattr(_local, "registros", None)
+        if registros is not None:
+            registros.append(self._registro)
+        self._memoria = memoria_residente()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        segundos = time.perf_counter() - self._inicio
+        memoria = memoria_residente()
+        _local.nivel = self._registro["nivel"]
+        self._registro.update({
+            "segundos": round(segundos, 6),
+            "linhas_entrada": self.entrada,
+            "linhas_saida": self._saida,
+            "memoria_delta_bytes": None if memoria is None or self._memoria is None else memoria - self._memoria,
+            "erro": None if tipo is None else tipo.__name__,
+        })
+        logger.info(json.dumps(self._registro, ensure_ascii=False))
+        return False
+
+
+class _EtapaInativa:
+    def saida(self, linhas):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, rastro):
+        return False
+
+
+_INATIVA = _EtapaInativa()
+
+
+def etapa(nome, entrada=None):
+    if not ATIVA:
+        return _INATIVA
+    return _Etapa(nome, entrada)
+
+
+# Marca o início de uma execução do script: as etapas seguintes, na mesma
+# thread, são registradas nela
+def inicia_execucao():
+    if ATIVA:
+        _local.execucao = next(_execucoes)
+        _local.registros = []
+        _local.nivel = 0
+
+
+def registros_da_execucao():
+    return list(getattr(_local, "registros", None) or [])
+
+
+# Decorador: cada chamada da função é medida como a etapa `nome`. Desligada a
+# instrumentação, devolve a própria função.
+def medido(nome):
+    def decora(funcao):
+        if not ATIVA:
+            return funcao
+
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with _Etapa(nome, None):
+                return funcao(*args, **kwargs)
+        return medida
+    return decora
@@ -0,0 +1,185 @@
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import configuracao
+
+# ------------------------------------------------------------------------------
+# Indicadores (KPIs) declarativos.
+# Cada KPI é uma soma ponderada de contas, definida no arquivo kpis.json:
+#   {"conta": "<nome>", "peso": <número>, "parte": "<parte>"}
+# onde "parte" indica qual valor mensal da conta entra na soma:
+#   liquido  -> soma dos lançamentos no mês (padrão)
+#   absoluto -> |soma dos lançamentos no mês|
+#   entradas -> soma dos lançamentos positivos
+#   saidas   -> soma dos lançamentos negativos
+# As definições são compiladas uma vez em uma matriz de pesos, e todos os KPIs
+# saem de um único produto matricial com o cubo mês x conta.
+# ------------------------------------------------------------------------------
+PARTES = ("liquido", "absoluto", "entradas", "saidas")
+PADRAO = "padrao"
+
+
+@dataclass
+class KpisCompilados:
+    nomes: list            # identificadores dos KPIs (K)
+    titulos: dict          # identificador -> título para exibição
+    contas: dict           # identificador -> contas usadas, na ordem da definição
+    pesos: np.ndarray      # (4 * A) x K, um bloco de A linhas por parte
+    uso: np.ndarray        # A x K, conta participa do KPI
+
+
+@lru_cache(maxsize=8)
+def _le_arquivo(caminho, modificado_em):
+    with open(caminho, encoding="utf-8") as arquivo:
+        definicoes = json.load(arquivo)
+    for kpis in [definicoes.get(PADRAO, {})] + list(definicoes.get("clientes", {}).values()):
+        for nome, kpi in kpis.items():
+            _valida_kpi(nome, kpi)
+    return definicoes
+
+
+def _valida_kpi(nome, kpi):
+    termos = kpi.get("termos")
+    if not isinstance(termos, list) or not termos:
+        raise ValueError(f"KPI '{nome}': a lista de termos está vazia ou ausente.")
+    for termo in termos:
+        if not isinstance(termo.get("conta"), str):
+            raise ValueError(f"KPI '{nome}': todo termo precisa de uma conta.")
+        if not isinstance(termo.get("peso", 1), (int, float)):
+            raise ValueError(f"KPI '{nome}': peso inválido para a conta '{termo['conta']}'.")
+        if termo.get("parte", "liquido") not in PARTES:
+            raise ValueError(f"KPI '{nome}': parte '{termo['parte']}' inválida (use {', '.join(PARTES)}).")
+
+
+def carrega_definicoes(caminho=None):
+    caminho = caminho or configuracao.ARQUIVO_KPIS
+    return _le_arquivo(caminho, os.path.getmtime(caminho))
+
+
+def clientes(definicoes):
+    return sorted(definicoes.get("clientes", {}))
+
+
+# KPIs do cliente: os do padrão, sobrescritos ou complementados pelos do cliente
+def kpis_do_cliente(definicoes, cliente=None):
+    kpis = dict(definicoes.get(PADRAO, {}))
+    if cliente:
+        kpis.update(definicoes.get("clientes", {}).get(cliente, {}))
+    return kpis
+
+
+def compila_kpis(kpis, contas):
+    contas = pd.Index(contas)
+    nomes = list(kpis)
+    pesos = np.zeros((len(PARTES) * len(contas), len(nomes)))
+    uso = np.zeros((len(contas), len(nomes)), dtype=bool)
+    contas_kpi = {}
+    for k, nome in enumerate(nomes):
+        contas_kpi[nome] = []
+        for termo in kpis[nome]["termos"]:
+            conta = termo["conta"]
+            if conta not in contas_kpi[nome]:
+                contas_kpi[nome].append(conta)
+            if conta not in contas:
+                continue
+            indice = contas.get_loc(conta)
+            parte = PARTES.index(termo.get("parte", "liquido"))
+            pesos[parte * len(contas) + indice, k] += termo.get("peso", 1)
+            uso[indice, k] = True
+    return KpisCompilados(
+        nomes=nomes,
+        titulos={nome: kpis[nome].get("titulo", nome) for nome in nomes},
+        contas=contas_kpi,
+        pesos=pesos,
+        uso=uso,
+    )
+
+
+@lru_cache(maxsize=32)
+def _compila_cacheado(caminho, modificado_em, cliente, contas):
+    definicoes = _le_arquivo(caminho, modificado_em)
+    return compila_kpis(kpis_do_cliente(definicoes, cliente), pd.Index(contas))
+
+
+# Compilação reaproveitada enquanto o arquivo de KPIs e o plano de contas não mudarem
+def compila_para_cliente(contas, cliente=None, caminho=None):
+    caminho = caminho or configuracao.ARQUIVO_KPIS
+    return _compila_cacheado(caminho, os.path.getmtime(caminho), cliente, tuple(contas))
+
+
+# ------------------------------------------------------------------------------
+# Cálculo sobre o cubo mês x conta
+# ------------------------------------------------------------------------------
+def calcula_kpis(cubo, compilado):
+    liquido = cubo.liquido
+    base = np.hstack([liquido, np.abs(liquido), cubo.positivo, cubo.negativo])
+    return pd.DataFrame(base @ compilado.pesos, columns=compilado.nomes,
+                        index=pd.Index(cubo.rotulos_meses, name="Mês/Ano"))
+
+
+# Meses em que alguma conta do KPI teve lançamentos
+def presenca_kpis(cubo, compilado):
+    return pd.DataFrame((cubo.quantidade @ compilado.uso.astype("int64")) > 0, columns=compilado.nomes,
+                        index=pd.Index(cubo.rotulos_meses, name="Mês/Ano"))
+
+
+# Valores mensais das contas que compõem o KPI, mais o próprio KPI
+def evolucao_kpi(cubo, compilado, valores, nome):
+    evolucao = pd.DataFrame({"Mês/Ano": cubo.rotulos_meses})
+    for conta in compilado.contas[nome]:
+        if conta in cubo.contas and cubo.quantidade[:, cubo.contas.get_loc(conta)].any():
+            evolucao[conta] = cubo.coluna(conta)
+    evolucao[compilado.titulos[nome]] = valores[nome].to_numpy()
+    return evolucao
+
+
+# Comparação mês a mês entre dois KPIs, no formato longo usado pelos gráficos
+def compara_kpis(valores, presenca, nome_a, rotulo_a, nome_b, rotulo_b):
+    meses = (presenca[nome_a] | presenca[nome_b]).to_numpy()
+    comparacao = pd.DataFrame({
+        "Mês/Ano": valores.index[meses].astype(object),
+        rotulo_a: valores[nome_a].to_numpy()[meses],
+        rotulo_b: np.abs(valores[nome_b].to_numpy()[meses]),
+    })
+    return comparacao.melt(id_vars="Mês/Ano", value_vars=[rotulo_a, rotulo_b],
+                           var_name="Tipo", value_name="Valor")
+
+
+# ------------------------------------------------------------------------------
+# Números do topo do dashboard, também usados no relatório em lote (lote.py)
+# ------------------------------------------------------------------------------
+# Totais do período e melhor mês da Contribuição Ajustada
+def metricas_periodo(cubo, valores):
+    entradas = float(cubo.positivo.sum())
+    saidas = float(cubo.negativo.sum())
+    contribuicao = valores['contribuicao_ajustada']
+    melhor = contribuicao.idxmax() if len(contribuicao) else None
+    return {
+        "entradas": entradas,
+        "saidas": abs(saidas),
+        "saldo": entradas + saidas,
+        "compras_mercadoria": float(valores['compras_mercadoria'].sum()),
+        "impostos_das": float(valores['impostos_das'].sum()),
+        "contribuicao_ajustada": float(contribuicao.sum()),
+        "melhor_mes": melhor,
+        "valor_melhor_mes": None if melhor is None else float(contribuicao[melhor]),
+    }
+
+
+# As mesmas métricas mês a mês
+def metricas_mensais(cubo, valores):
+    entradas = cubo.positivo.sum(axis=1)
+    saidas = cubo.negativo.sum(axis=1)
+    return pd.DataFrame({
+        "entradas": entradas,
+        "saidas": np.abs(saidas),
+        "saldo": entradas + saidas,
+        "compras_mercadoria": valores['compras_mercadoria'].to_numpy(),
+        "impostos_das": valores['impostos_das'].to_numpy(),
+        "contribuicao_ajustada": valores['contribuicao_ajustada'].to_numpy(),
+    }, index=valores.index)
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import configuracao
+from agregacao import monta_cubo
+from ingestao import le_razao
+from kpis import calcula_kpis, carrega_definicoes, clientes, compila_para_cliente, metricas_mensais, metricas_periodo
+from razao import SEM_MES
+
+# ------------------------------------------------------------------------------
+# Processamento em lote (sem interface): calcula para cada planilha de um
+# diretório os mesmos números do topo do dashboard (entradas, saídas, saldo,
+# DAS, Contribuição Ajustada por mês e melhor mês) e consolida tudo num
+# relatório XLSX ou Parquet.
+# Uso: python -m lote <diretorio> [--saida relatorio.xlsx] [--processos N]
+#
+# As planilhas são processadas em paralelo (um processo por núcleo). O
+# resultado de cada cliente é gravado assim que fica pronto em
+# <saida>.parcial/, junto com o estado do lote; se a execução cair, rodar o
+# mesmo comando de novo processa só as planilhas que faltaram, falharam ou
+# mudaram desde então (--do-zero ignora o que já foi feito).
+# ------------------------------------------------------------------------------
+EXTENSOES = (".xlsx", ".xlsm")
+
+# Métrica -> título no relatório
+TITULOS = {
+    "entradas": "Entradas",
+    "saidas": "Saídas",
+    "saldo": "Saldo",
+    "compras_mercadoria": "Compras de Mercadoria",
+    "impostos_das": "Impostos (DAS)",
+    "contribuicao_ajustada": "Contribuição Ajustada",
+    "melhor_mes": "Melhor Mês",
+    "valor_melhor_mes": "Contribuição no Melhor Mês",
+}
+
+
+def lista_planilhas(diretorio):
+    planilhas = []
+    for raiz, _, arquivos in os.walk(diretorio):
+        for nome in arquivos:
+            if nome.lower().endswith(EXTENSOES) and not nome.startswith("~$"):
+                planilhas.append(os.path.relpath(os.path.join(raiz, nome), diretorio))
+    return sorted(planilhas)
+
+
+# Cliente de uma planilha: o nome do arquivo, sem extensão
+def nome_cliente(planilha):
+    return os.path.splitext(os.path.basename(planilha))[0]
+
+
+# Muda quando a planilha ou as definições de KPIs mudam
+def assinatura(caminho, arquivo_kpis):
+    info = os.stat(caminho)
+    return [info.st_size, info.st_mtime_ns, os.path.getmtime(arquivo_kpis)]
+
+
+def _arquivo_parcial(diretorio_parcial, planilha):
+    nome = hashlib.blake2b(planilha.encode(), digest_size=12).hexdigest()
+    return os.path.join(diretorio_parcial, f"{nome}.parquet")
+
+
+# ------------------------------------------------------------------------------
+# Trabalho de cada processo: uma planilha
+# ------------------------------------------------------------------------------
+def processa_planilha(caminho, cliente, cliente_kpis, destino):
+    inicio = time.perf_counter()
+    df = le_razao(caminho)
+    cubo = monta_cubo(df)
+    valores = calcula_kpis(cubo, compila_para_cliente(cubo.contas, cliente_kpis))
+    periodo = metricas_periodo(cubo, valores)
+    mensal = metricas_mensais(cubo, valores).reset_index()
+    mensal.insert(0, "cliente", cliente)
+    temporario = destino + ".tmp"
+    mensal.to_parquet(temporario, index=False)
+    os.replace(temporario, destino)
+    sem_data = int((df["MesCodigo"] == SEM_MES).sum())
+    return {"linhas": len(df), "sem_data": sem_data, "periodo": periodo, "segundos": time.perf_counter() - inicio}
+
+
+# ------------------------------------------------------------------------------
+# Estado do lote (para retomar)
+# ------------------------------------------------------------------------------
+def le_estado(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return {}
+
+
+def grava_estado(caminho, estado):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(estado, arquivo, indent=1, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+# ------------------------------------------------------------------------------
+# Relatório consolidado
+# ------------------------------------------------------------------------------
+def monta_relatorio(planilhas, estado, diretorio_parcial):
+    resumo = []
+    partes = []
+    for planilha in planilhas:
+        item = estado.get(planilha, {})
+        linha = {"cliente": nome_cliente(planilha), "arquivo": planilha,
+                 "situacao": item.get("situacao", "pendente"), "linhas": item.get("linhas"),
+                 "sem_data": item.get("sem_data"),
+                 "segundos": item.get("segundos"), "erro": item.get("erro")}
+        if item.get("situacao") == "ok":
+            linha.update(item["periodo"])
+            partes.append(pd.read_parquet(_arquivo_parcial(diretorio_parcial, planilha)))
+        resumo.append(linha)
+    colunas_resumo = ["cliente", "arquivo", "situacao", "linhas", "sem_data", "segundos"] + list(TITULOS) + ["erro"]
+    resumo = pd.DataFrame(resumo).reindex(columns=colunas_resumo)
+    if partes:
+        mensal = pd.concat(partes, ignore_index=True)
+    else:
+        mensal = pd.DataFrame(columns=["cliente", "Mês/Ano"] + list(TITULOS)[:6])
+    renomeia = dict(TITULOS, cliente="Cliente", arquivo="Arquivo", situacao="Situação", linhas="Linhas",
+                    sem_data="Linhas sem Data",
+                    segundos="Tempo (s)", erro="Erro")
+    return resumo.rename(columns=renomeia), mensal.rename(columns=renomeia)
+
+
+# XLSX com as planilhas Resumo (uma linha por cliente) e Mensal; em Parquet,
+# <saida> recebe a tabela mensal e <saida sem extensão>_resumo.parquet o resumo
+def grava_relatorio(saida, resumo, mensal):
+    if saida.lower().endswith(".parquet"):
+        mensal.to_parquet(saida, index=False)
+        resumo.to_parquet(os.path.splitext(saida)[0] + "_resumo.parquet", index=False)
+        return
+    with pd.ExcelWriter(saida, engine="xlsxwriter") as writer:
+        resumo.to_excel(writer, index=False, sheet_name="Resumo")
+        mensal.to_excel(writer, index=False, sheet_name="Mensal")
+
+
+def executa(diretorio, saida, processos=None, cliente_kpis=None, do_zero=False, saida_log=sys.stdout):
+    diretorio_parcial = saida + ".parcial"
+    caminho_estado = os.path.join(diretorio_parcial, "estado.json")
+    if do_zero:
+        shutil.rmtree(diretorio_parcial, ignore_errors=True)
+    os.makedirs(diretorio_parcial, exist_ok=True)
+
+    arquivo_kpis = configuracao.ARQUIVO_KPIS
+    clientes_kpis = set(clientes(carrega_definicoes(arquivo_kpis)))
+    planilhas = lista_planilhas(diretorio)
+    estado = le_estado(caminho_estado)
+    assinaturas = {p: assinatura(os.path.join(diretorio, p), arquivo_kpis) for p in planilhas}
+    pendentes = [p for p in planilhas
+                 if estado.get(p, {}).get("situacao") != "ok" or estado[p].get("assinatura") != assinaturas[p]]
+    print(f"{len(planilhas)} planilha(s); {len(planilhas) - len(pendentes)} já processada(s), "
+          f"{len(pendentes)} a processar.", file=saida_log)
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processos or os.cpu_count()) as executor:
+        futuros = {}
+        for planilha in pendentes:
+            cliente = nome_cliente(planilha)
+            kpis_cliente = cliente_kpis or (cliente if cliente in clientes_kpis else None)
+            futuro = executor.submit(processa_planilha, os.path.join(diretorio, planilha), cliente, kpis_cliente,
+                                     _arquivo_parcial(diretorio_parcial, planilha))
+            futuros[futuro] = planilha
+        for n, futuro in enumerate(as_completed(futuros), start=1):
+            planilha = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as erro:
+                estado[planilha] = {"situacao": "erro", "erro": f"{type(erro).__name__}: {erro}"}
+                print(f"[{n}/{len(pendentes)}] {planilha}: ERRO - {estado[planilha]['erro']}", file=saida_log)
+            else:
+                estado[planilha] = dict(resultado, situacao="ok", assinatura=assinaturas[planilha])
+                print(f"[{n}/{len(pendentes)}] {planilha}: {resultado['linhas']:,} linhas em "
+                      f"{resultado['segundos']:.2f} s", file=saida_log)
+            grava_estado(caminho_estado, estado)
+
+    resumo, mensal = monta_relatorio(planilhas, estado, diretorio_parcial)
+    grava_relatorio(saida, resumo, mensal)
+    falhas = int((resumo["Situação"] != "ok").sum())
+    print(f"Relatório gravado em {saida} ({time.perf_counter() - inicio:.1f} s; {falhas} falha(s)).",
+          file=saida_log)
+    return falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indicadores do dashboard para todas as planilhas de um diretório.")
+    parser.add_argument("diretorio", help="diretório com as planilhas (uma por cliente; busca em subdiretórios)")
+    parser.add_argument("--saida", default="relatorio.xlsx", help="arquivo do relatório (.xlsx ou .parquet)")
+    parser.add_argument("--processos", type=int, default=None, help="processos em paralelo (padrão: núcleos)")
+    parser.add_argument("--cliente-kpis", default=None,
+                        help="cliente do kpis.json para todas as planilhas (padrão: o nome do arquivo, se definido)")
+    parser.add_argument("--do-zero", action="store_true", help="ignora resultados de execuções anteriores")
+    args = parser.parse_args()
+    falhas = executa(args.diretorio, args.saida, args.processos, args.cliente_kpis, args.do_zero)
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Paginação com ordenação no servidor.
+# Só as linhas da página pedida são extraídas do razão; para as primeiras
+# páginas usa-se uma ordenação parcial (top-k) em vez de ordenar tudo.
+# ------------------------------------------------------------------------------
+
+# Até essa fração das linhas, a seleção parcial compensa mais que ordenar tudo
+FRACAO_TOP_K = 0.25
+
+
+# Chave numérica de ordenação; valores ausentes viram NaN e vão para o final
+def _chave(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        codigos = serie.cat.codes.to_numpy().astype("float64")
+        codigos[codigos < 0] = np.nan
+        return codigos
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        chave = serie.to_numpy().astype("datetime64[ns]").astype("int64").astype("float64")
+        chave[serie.isna().to_numpy()] = np.nan
+        return chave
+    return pd.to_numeric(serie, errors="coerce").to_numpy(dtype="float64")
+
+
+# Posições (relativas a `posicoes`) das linhas de `inicio` até `fim` na ordem pedida
+def _ordem(chave, ascendente, inicio, fim):
+    chave = chave if ascendente else -chave
+    chave = np.where(np.isnan(chave), np.inf, chave)
+    if fim < len(chave) * FRACAO_TOP_K:
+        if fim == 0:
+            return np.array([], dtype="int64")
+        # Todas as linhas empatadas com a fim-ésima entram na disputa, e o
+        # desempate é pela posição original, como na ordenação estável
+        limite = chave[np.argpartition(chave, fim - 1)[fim - 1]]
+        primeiros = np.flatnonzero(chave <= limite)
+        ordem = primeiros[np.lexsort((primeiros, chave[primeiros]))][:fim]
+    else:
+        ordem = np.argsort(chave, kind="stable")
+    return ordem[inicio:fim]
+
+
+def total_paginas(n_linhas, tamanho):
+    return max(1, -(-n_linhas // tamanho))
+
+
+# Posições (relativas a `serie`) das linhas da página `pagina` (começando em 1)
+# na ordem pedida
+def ordem_da_pagina(serie, ascendente, pagina, tamanho):
+    inicio = min((pagina - 1) * tamanho, len(serie))
+    fim = min(inicio + tamanho, len(serie))
+    return _ordem(_chave(serie), ascendente, inicio, fim)
+
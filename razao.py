@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------------------
+# Representação compacta do razão contábil.
+# Contas e grupos viram categorias (códigos inteiros) e o período vira um código
+# inteiro de mês (ano * 12 + mês - 1). Filtros e agrupamentos trabalham sobre os
+# códigos; os rótulos ("2024-01", nome da conta) só são gerados para exibição.
+# ------------------------------------------------------------------------------
+SEM_MES = -1
+
+
+def codigo_mes(datas):
+    datas = pd.DatetimeIndex(datas)
+    codigos = (datas.year.to_numpy(dtype="float64") * 12 + datas.month.to_numpy(dtype="float64") - 1)
+    return np.where(np.isnan(codigos), SEM_MES, codigos).astype("int32")
+
+
+def rotulo_mes(codigo):
+    if codigo == SEM_MES:
+        return "NaT"
+    ano, mes = divmod(int(codigo), 12)
+    return f"{ano:04d}-{mes + 1:02d}"
+
+
+def rotulos_meses(codigos):
+    return [rotulo_mes(c) for c in codigos]
+
+
+def normaliza_razao(df):
+    normalizado = pd.DataFrame(index=pd.RangeIndex(len(df)))
+    normalizado["Data"] = pd.to_datetime(df["Data"].to_numpy())
+    normalizado["ContaContabil"] = _categoria(df["ContaContabil"])
+    normalizado["Valor"] = pd.to_numeric(df["Valor"], errors="coerce").to_numpy(dtype="float64")
+    if "GrupoDeConta" in df.columns:
+        normalizado["GrupoDeConta"] = _categoria(df["GrupoDeConta"])
+    normalizado["MesCodigo"] = codigo_mes(normalizado["Data"])
+    return normalizado
+
+
+# Coluna de texto como categoria; uma coluna que já é categórica (leitura do
+# Excel, ver ingestao._monta_df) só tem as categorias conferidas, sem percorrer
+# os textos de cada linha
+def _categoria(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        categorico = serie.array.remove_unused_categories()
+        return categorico.set_categories(une_categorias(categorico.categories))
+    valores = pd.Series(serie.to_numpy(), dtype=object)
+    return pd.Categorical(valores, categories=une_categorias(valores.dropna().unique()))
+
+
+# Categorias de várias planilhas juntas, na mesma ordem usada por uma só
+def une_categorias(*categorias):
+    return sorted(set().union(*categorias), key=str)
+
+
+# Concatena razões já normalizados (por exemplo, uma planilha por mês). As
+# categorias de conta e grupo são unificadas, de forma que o resultado é igual
+# ao de normalizar todas as linhas de uma vez. `categorias` ({coluna: categorias})
+# fixa as categorias de saída em vez da união das presentes.
+def junta_razoes(dfs, categorias=None):
+    categorias = categorias or {}
+    if len(dfs) == 1 and all(coluna in dfs[0].columns and dfs[0][coluna].cat.categories.equals(pd.Index(c))
+                             for coluna, c in categorias.items()):
+        return dfs[0]
+    partes = [df.copy(deep=False) for df in dfs]
+    for coluna in ("ContaContabil", "GrupoDeConta"):
+        presentes = [df[coluna].cat.categories for df in dfs if coluna in df.columns]
+        if not presentes and coluna not in categorias:
+            continue
+        unidas = categorias.get(coluna)
+        unidas = une_categorias(*presentes) if unidas is None else unidas
+        for parte in partes:
+            if coluna in parte.columns:
+                parte[coluna] = parte[coluna].cat.set_categories(unidas)
+            else:
+                parte[coluna] = pd.Categorical([None] * len(parte), categories=unidas)
+    colunas = [c for c in ["Data", "ContaContabil", "Valor", "GrupoDeConta", "MesCodigo"] if c in partes[0].columns]
+    return pd.concat([parte[colunas] for parte in partes], ignore_index=True)
+
+
+def meses_presentes(df):
+    return np.unique(df["MesCodigo"].to_numpy())
+
+
+# Troca a coluna de código de mês pelo rótulo "Mês/Ano" usado na exibição
+def com_rotulo_mes(df, coluna="MesCodigo"):
+    rotulos = {c: rotulo_mes(c) for c in np.unique(df[coluna].to_numpy())}
+    df = df.rename(columns={coluna: "Mês/Ano"})
+    df["Mês/Ano"] = df["Mês/Ano"].map(rotulos)
+    return df